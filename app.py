@@ -1,28 +1,54 @@
 from __future__ import annotations
 
-from flask import Flask, request, jsonify, abort, g, render_template, send_from_directory
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from flask import Flask, Response, request, jsonify, abort, g, render_template, send_from_directory, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import os, json, time, uuid
-from datetime import datetime, timedelta, timezone
+import base64
+import bisect
+import heapq
+import math
+from datetime import date, datetime, timedelta, timezone
 import logging
 import re
 import threading
-from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import hmac
+import click
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
+from metrics import LATENCY_BUCKETS, METRICS
+from note_parser import parse_note
+from store import (MAX_KEY, STORE_BACKEND, STORE_SHARED, FileBackedStore, NoteRecords, Store,
+                   json_default, open_store, transaction)
 
 
 # ---------------------------
 # Logging setup
 # ---------------------------
+# Log calls use lazy %-formatting: messages below LOG_LEVEL are never built.
 logging.basicConfig(
-    level=logging.DEBUG,  # Default logging level
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
 )
 logger = logging.getLogger(__name__)
 
+class _JSONProvider(DefaultJSONProvider):
+    @staticmethod
+    def default(o: Any) -> Any:
+        if isinstance(o, Mapping):
+            return dict(o)
+        return DefaultJSONProvider.default(o)
+
+
 app = Flask(__name__, static_folder="static", static_url_path="")
-CORS(app)
+app.json = _JSONProvider(app)
+CORS(app, expose_headers=["X-Next-Cursor", "ETag"])
 
 NOTES_FILE = "notes.json"
 TAGS_FILE = "tags.json"
@@ -38,137 +64,635 @@ CATEGORIES = {
     "Generic": "+",
     "Journal": ""
 }
+TASK_PRIORITIES = ("low", "mid", "high")
+MAX_COUNT_RANGE_DAYS = 3660
+MAX_PAGE_LIMIT = 1000
+SEARCH_DEFAULT_LIMIT = 50
+TASKS_DEFAULT_LIMIT = 100
+SEARCH_MAX_PREFIX_TERMS = 64  # vocabulary terms a single query prefix may expand to
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_ERRORS = 100  # per-line errors reported back by an import
+RESPONSE_CACHE_BYTES = int(os.getenv("RESPONSE_CACHE_BYTES", str(64 * 1024 * 1024)))
 TOKEN_TTL_SECONDS = int(os.getenv("TOKEN_TTL_SECONDS", "14400"))  # 4 hours
+SESSION_MAX_PER_USER = int(os.getenv("SESSION_MAX_PER_USER", "10"))  # oldest sessions are evicted past this
+SESSION_SWEEP_SECONDS = int(os.getenv("SESSION_SWEEP_SECONDS", "60"))
+# Password hashing is deliberately slow: signin runs it on at most SIGNIN_WORKERS
+# threads with SIGNIN_QUEUE more attempts waiting (503 beyond), behind per-username
+# and per-client token buckets (429), and skips it for credentials verified in the
+# last SIGNIN_CACHE_SECONDS. Hashes not made with PASSWORD_HASH_METHOD (a werkzeug
+# method such as "scrypt:16384:8:1" or "pbkdf2:sha256:600000") are upgraded at signin.
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+SIGNIN_WORKERS = int(os.getenv("SIGNIN_WORKERS", "2"))
+SIGNIN_QUEUE = int(os.getenv("SIGNIN_QUEUE", "8"))
+SIGNIN_USER_RATE = float(os.getenv("SIGNIN_USER_RATE", "5"))  # attempts per minute
+SIGNIN_USER_BURST = int(os.getenv("SIGNIN_USER_BURST", "5"))
+SIGNIN_IP_RATE = float(os.getenv("SIGNIN_IP_RATE", "30"))
+SIGNIN_IP_BURST = int(os.getenv("SIGNIN_IP_BURST", "20"))
+SIGNIN_CACHE_SECONDS = int(os.getenv("SIGNIN_CACHE_SECONDS", "300"))
+# Bearer token a metrics scraper may use on /api/metrics instead of a user session.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
 
 # ------------------ Data ------------------
-class FileBackedStore:
-    def __init__(self, name: str, file_path: str, search_key: str):
-        self._name = name
-        self.file_path = file_path
+# Store settings (STORE_BACKEND, STORE_MODE, STORE_SHARED, STORE_SYNC...) are read in store.py.
+SESSIONS_FILE = "sessions.json"
+# The JSON notes store keeps notes as compact NoteRecords. NOTES_TEXT_ON_DISK=1
+# also moves note texts out of memory, into a scratch file next to the notes
+# file that is rebuilt at every start (the snapshot and journal stay the source).
+NOTES_TEXT_ON_DISK = os.getenv("NOTES_TEXT_ON_DISK", "0") == "1"
+
+METRICS.histogram("journote_http_request_duration_seconds", "Request latency by route.",
+                  ("method", "route", "status"), LATENCY_BUCKETS)
+
+
+class TagTree:
+    """Parent -> children adjacency of a tags store, with cached subtree closures.
+
+    Mirrors the `parent` field of every tag through a store listener, so it stays
+    consistent with tag patches and renames without rescanning the store.
+    """
+    def __init__(self, store: Store):
+        self._store = store
         self._lock = threading.RLock()
-        self._data: Dict[str, Any] = {}
-        self._load()
-        self._search_key = search_key
-        logger.info(f"FileBackedStore[{self._name}] (init) Initialized with {self.file_path}")
-
-    def _load(self):
-        """Load data from file or initialize default state."""
-        if not os.path.exists(self.file_path):
-            logger.info(f"FileBackedStore[{self._name}] (load) Data file '{self.file_path}' not found in {os.getcwd()}, initializing with default admin user")
-            self._data = []
-            self._save()
-            return
-        logger.info(f"FileBackedStore[{self._name}] (load) Loading data from {self.file_path}")
-        with open(self.file_path, "r", encoding="utf-8") as f:
-            self._data = json.load(f)
-
-    def _save(self):
-        """Atomic write: write to temp file then replace."""
-        logger.debug(f"FileBackedStore[{self._name}] (save) Persisting data to {self.file_path}")
-        with open(self.file_path, "w", encoding="utf-8") as f:
-            json.dump(self._data, f, ensure_ascii=False, indent=2)
-            f.flush()
-            os.fsync(f.fileno())
-
-    def find_by_id(self, value_to_search: str) -> Optional[Dict[str, Any]]:
-        logger.debug(f"FileBackedStore[{self._name}] (find_by_id) value_to_search='{value_to_search}'")
+        self._parent: Dict[str, Optional[str]] = {}
+        self._children: Dict[Optional[str], Dict[str, None]] = {}
+        self._closure: Dict[str, List[str]] = {}
+        store.add_listener(self._on_change)
+
+    def _on_change(self, op: str, key: Optional[str], obj: Optional[Dict[str, Any]]):
         with self._lock:
-            return next((u for u in self._data if u[self._search_key] == value_to_search), None)
+            self._closure.clear()
+            if op == "reload":
+                self._parent.clear()
+                self._children.clear()
+                for tag in self._store.find_all():
+                    self._link(tag["name"], tag.get("parent"))
+                return
+            if key is not None:
+                self._unlink(key)
+            if op != "delete":
+                self._link(obj["name"], obj.get("parent"))
+
+    def _link(self, name: str, parent: Optional[str]):
+        self._parent[name] = parent
+        self._children.setdefault(parent, {})[name] = None
+
+    def _unlink(self, name: str):
+        if name not in self._parent:
+            return
+        parent = self._parent.pop(name)
+        siblings = self._children.get(parent)
+        if siblings is not None:
+            siblings.pop(name, None)
+            if not siblings:
+                del self._children[parent]
 
-    def find_eq(self, key_to_search: str, value_to_search: str) -> Optional[Dict[str, Any]]:
-        logger.debug(f"FileBackedStore[{self._name}] (find_eq) key_to_search='{key_to_search}', value_to_search='{value_to_search}'")
+    def subtree(self, tag: str) -> List[str]:
+        """`tag` followed by all its descendants (breadth-first, cycle-safe)."""
         with self._lock:
-            return [u for u in self._data if value_to_search == u[key_to_search]]
+            cached = self._closure.get(tag)
+            if cached is None:
+                cached = [tag]
+                seen = {tag}
+                for current in cached:
+                    for child in self._children.get(current, ()):
+                        if child not in seen:
+                            seen.add(child)
+                            cached.append(child)
+                self._closure[tag] = cached
+            return list(cached)
+
+
+class DailyCounts:
+    """Running date -> number of notes (and of tasks) aggregate over a notes store."""
+    def __init__(self, store: Store):
+        self._store = store
+        self._lock = threading.RLock()
+        self._notes: Dict[str, int] = {}
+        self._tasks: Dict[str, int] = {}
+        # note id -> (date, is_task) it is currently counted under
+        self._counted: Dict[str, Tuple[str, bool]] = {}
+        store.add_listener(self._on_change)
 
-    def find_in_list(self, key_to_search: str, value_to_search: str) -> Optional[Dict[str, Any]]:
-        logger.debug(f"FileBackedStore[{self._name}] (find_in_list) key_to_search='{key_to_search}', value_to_search='{value_to_search}'")
+    def _on_change(self, op: str, key: Optional[str], obj: Optional[Dict[str, Any]]):
         with self._lock:
-            return [u for u in self._data if value_to_search in u[key_to_search]]
+            if op == "reload":
+                self._notes.clear()
+                self._tasks.clear()
+                self._counted.clear()
+                for note in self._store.find_all():
+                    self._count(note["id"], note)
+                return
+            if key is not None:
+                self._uncount(key)
+            if op != "delete":
+                self._count(obj["id"], obj)
+
+    def _count(self, key: str, note: Dict[str, Any]):
+        day, is_task = note["date"], note.get("task") in TASK_PRIORITIES
+        self._notes[day] = self._notes.get(day, 0) + 1
+        self._counted[key] = (day, is_task)
+        if is_task:
+            self._tasks[day] = self._tasks.get(day, 0) + 1
 
+    def _uncount(self, key: str):
+        if key not in self._counted:
+            return
+        day, is_task = self._counted.pop(key)
+        for counts, counted in ((self._notes, True), (self._tasks, is_task)):
+            if counted:
+                counts[day] -= 1
+                if not counts[day]:
+                    del counts[day]
 
-    def find_any(self, key_to_search: str, value_to_search: str) -> Optional[Dict[str, Any]]:
-        logger.debug(f"FileBackedStore[{self._name}] (find_any) key_to_search='{key_to_search}', value_to_search='{value_to_search}'")
+    def between(self, first: date, last: date) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """Per-day note and task counts for every day in [first, last], zeros included."""
+        days = [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
         with self._lock:
-            return [u for u in self._data if u.get(key_to_search) in value_to_search]
-            
-    def find_all(self) -> Optional[Dict[str, Any]]:
-        logger.debug(f"FileBackedStore[{self._name}] (find_all)")
-        return self._data
-        
-    def _find_entity_index(self, key: str) -> Optional[int]:
-        for i, e in enumerate(self._data):
-            if e.get(self._search_key) == key:
-                return i
-        return None
+            return ({d: self._notes.get(d, 0) for d in days}, {d: self._tasks.get(d, 0) for d in days})
+
+
+class TaskIndex:
+    """Tasks of a notes store ordered by (due date, priority), maintained through a store listener.
 
-    def add(self, obj: Dict) -> Dict[str, Any]:
-        logger.info(f"FileBackedStore[{self._name}] (add) '{obj[self._search_key]}'")
+    One list per priority holds (due, note id) sorted; tasks without a due date
+    sort last. Queries merge the lists lazily, so a page costs O(limit) however
+    many notes the store holds.
+    """
+    RANKS = {"high": 0, "mid": 1, "low": 2}
+
+    def __init__(self, store: Store):
+        self._store = store
+        self._lock = threading.RLock()
+        self._lists: Dict[str, List[Tuple[str, str]]] = {priority: [] for priority in self.RANKS}
+        # note id -> (priority, due) it is currently listed under
+        self._listed: Dict[str, Tuple[str, str]] = {}
+        store.add_listener(self._on_change)
+
+    def _on_change(self, op: str, key: Optional[str], obj: Optional[Dict[str, Any]]):
         with self._lock:
-            if self.find_by_id(obj[self._search_key]):
-                logger.warning(f"FileBackedStore[{self._name}] (add) Attempt to add existing object")
-                raise ValueError("Already exists.")
-            # user = {"username": username, "password_hash": generate_password_hash(password_plain)}
-            self._data.append(obj)
-            self._save()
-        return obj
-
-    def delete(self, key: str) -> None:
-        logger.info(f"FileBackedStore[{self._name}] (delete) '{key}'")
+            if op == "reload":
+                for entries in self._lists.values():
+                    entries.clear()
+                self._listed.clear()
+                for note in self._store.find_any("task", TASK_PRIORITIES):
+                    self._list(note["id"], note)
+                return
+            if key is not None:
+                self._unlist(key)
+            if op != "delete":
+                self._list(obj["id"], obj)
+
+    def _list(self, key: str, note: Dict[str, Any]):
+        priority = note.get("task")
+        if priority not in self.RANKS:
+            return
+        due = note.get("duedate") or MAX_KEY
+        bisect.insort(self._lists[priority], (due, key))
+        self._listed[key] = (priority, due)
+
+    def _unlist(self, key: str):
+        if key not in self._listed:
+            return
+        priority, due = self._listed.pop(key)
+        entries = self._lists[priority]
+        i = bisect.bisect_left(entries, (due, key))
+        if i < len(entries) and entries[i] == (due, key):
+            del entries[i]
+
+    @staticmethod
+    def _stream(entries: List[Tuple[str, str]], start: int, rank: int) -> Iterable[Tuple[str, int, str]]:
+        for i in range(start, len(entries)):  # islice would walk the skipped prefix
+            due, key = entries[i]
+            yield due, rank, key
+
+    def query(self, priorities: Iterable[str] = TASK_PRIORITIES, lower: str = "", upper: str = MAX_KEY,
+              after: Optional[Tuple[str, int, str]] = None, limit: int = TASKS_DEFAULT_LIMIT) -> List[Tuple[str, int, str]]:
+        """Up to `limit` (due, rank, note id) with lower <= due < upper, ordered, starting past `after`.
+
+        `upper` is exclusive: the default excludes tasks without a due date, pass
+        None to include them.
+        """
         with self._lock:
-            idx = self._find_entity_index(key)
-            if idx is None:
-                logger.warning(f"FileBackedStore[{self._name}] (delete) id='{key}' not found for delete")
-                raise KeyError("Object not found.")
-            elem = self._data[idx]
-            del self._data[idx]
-            self._save()
-            return elem
-
-    def patch(self, key: str, obj: Dict) -> Dict[str, Any]:
-        logger.info(f"FileBackedStore[{self._name}] (patch) '{key}'")
+            streams = []
+            for priority in priorities:
+                entries, rank = self._lists[priority], self.RANKS[priority]
+                start = bisect.bisect_left(entries, (lower,))
+                if after is not None:
+                    due, after_rank, key = after
+                    # (due, key) tuples of this rank that sort after the cursor
+                    bound = (due, key) if rank == after_rank else (due, MAX_KEY) if rank < after_rank else (due,)
+                    start = max(start, bisect.bisect_right(entries, bound) if rank <= after_rank else bisect.bisect_left(entries, bound))
+                streams.append(self._stream(entries, start, rank))
+            page = []
+            for entry in heapq.merge(*streams):
+                if (upper is not None and entry[0] >= upper) or len(page) == limit:
+                    break
+                page.append(entry)
+            return page
+
+
+class SearchIndex:
+    """Inverted index over note text: term -> {note id: term frequency}.
+
+    The vocabulary is kept sorted so that every query term also matches as a
+    prefix; all query terms must match. Results are ranked by tf-idf, with
+    prefix-only matches weighted at half of exact ones.
+    """
+    _WORD_RE = re.compile(r"\w+")
+
+    def __init__(self, store: Store):
+        self._store = store
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._terms: List[str] = []
+        # note id -> term frequencies it is indexed under
+        self._doc_terms: Dict[str, Dict[str, int]] = {}
+        store.add_listener(self._on_change)
+
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        return [t.casefold() for t in cls._WORD_RE.findall(text)]
+
+    def _on_change(self, op: str, key: Optional[str], obj: Optional[Dict[str, Any]]):
         with self._lock:
-            idx = self._find_entity_index(key)
-            if idx is None:
-                logger.warning(f"FileBackedStore[{self._name}] (patch) id='{key}' not found for patch")
-                raise KeyError("Object not found.")
-            current = dict(self._data[idx])
-            for k, v in obj.items():
-                if k != self._search_key:
-                    current[k] = v
-            self._data[idx] = current
-            self._save()
-            return current
-
-    def re_id(self, old_key, new_key):
-        logger.info(f"FileBackedStore[{self._name}] (re_id) '{old_key}' '{new_key}'")
+            if op == "reload":
+                self._postings.clear()
+                self._terms.clear()
+                self._doc_terms.clear()
+                for note in self._store.find_all():
+                    self._index(note["id"], note.get("text", ""))
+                return
+            if key is not None:
+                self._unindex(key)
+            if op != "delete":
+                self._index(obj["id"], obj.get("text", ""))
+
+    def _index(self, key: str, text: str):
+        frequencies: Dict[str, int] = {}
+        for term in self.tokenize(text):
+            frequencies[term] = frequencies.get(term, 0) + 1
+        self._doc_terms[key] = frequencies
+        for term, tf in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._terms, term)
+            postings[key] = tf
+
+    def _unindex(self, key: str):
+        for term in self._doc_terms.pop(key, ()):
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def _expand(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self._terms, prefix)
+        expanded = []
+        for term in self._terms[start:start + SEARCH_MAX_PREFIX_TERMS]:
+            if not term.startswith(prefix):
+                break
+            expanded.append(term)
+        return expanded
+
+    def search(self, query: str, limit: int) -> List[str]:
+        """Ids of the best `limit` notes matching every term of `query`, best first."""
+        terms = set(self.tokenize(query))
+        if not terms:
+            return []
         with self._lock:
-            idx = self._find_entity_index(old_key)
-            if idx is None:
-                logger.warning(f"FileBackedStore[{self._name}] (re_id) id='{old_key}' not found for patch")
-                raise KeyError("Object not found.")
-            self._data[idx][self._search_key] = new_key
-            self._save()
-            return self._data[idx]
-            
-
-STORE_USERS = FileBackedStore('users', USER_FILE, 'username')
-STORE_NOTES = FileBackedStore('notes', NOTES_FILE, 'id')
-STORE_TAGS = FileBackedStore('tags', TAGS_FILE, 'name')
+            total = len(self._doc_terms)
+            scores: Optional[Dict[str, float]] = None
+            for prefix in terms:
+                matched: Dict[str, float] = {}
+                for term in self._expand(prefix):
+                    postings = self._postings[term]
+                    weight = math.log(1 + total / len(postings)) * (1.0 if term == prefix else 0.5)
+                    for key, tf in postings.items():
+                        matched[key] = matched.get(key, 0.0) + (1 + math.log(tf)) * weight
+                if scores is None:
+                    scores = matched
+                else:
+                    scores = {key: score + matched[key] for key, score in scores.items() if key in matched}
+                if not scores:
+                    return []
+        return [key for key, _ in heapq.nlargest(limit, scores.items(), key=lambda item: item[1])]
+
+
+class ChangeLog:
+    """Changes of a set of stores since a revision, read from the stores' change feeds.
+
+    A revision joins the store versions, which every process derives from the
+    same shared state (journal position, SQLite change id), so any worker can
+    answer for a revision another one handed out. A revision older than the
+    changes a store retains (CHANGELOG_SIZE), or preceding a store reload, needs
+    a full resync. Shared JSON stores in snapshot mode reload on every change of
+    another process: with several workers, use journal mode or SQLite.
+    """
+    def __init__(self, stores: Dict[str, Store]):
+        self._stores = stores
+
+    def revision(self) -> str:
+        return "-".join(store.version for store in self._stores.values())
+
+    def since(self, revision: str) -> Optional[Tuple[str, Dict[str, Dict[str, Any]]]]:
+        """Changes after `revision` as (current revision, {store: changes}), or None if a resync is needed."""
+        versions = revision.split("-")
+        if len(versions) != len(self._stores):
+            return None
+        # taken first: changes made meanwhile are reported again from it, never missed
+        current = self.revision()
+        states: Dict[str, Dict[str, str]] = {name: {} for name in self._stores}
+        renamed: Dict[str, List[Dict[str, str]]] = {name: [] for name in self._stores}
+        for (name, store), version in zip(self._stores.items(), versions):
+            entries = store.changes_since(version)
+            if entries is None:
+                return None
+            for op, key, new_key in entries:
+                if op == "re_id":
+                    states[name][key] = "deleted"
+                    states[name][new_key] = "upserted"
+                    renamed[name].append({"from": key, "to": new_key})
+                else:
+                    states[name][key] = "deleted" if op == "delete" else "upserted"
+        changes = {}
+        for name, store in self._stores.items():
+            upserted = [store.find_by_id(k) for k, state in states[name].items() if state == "upserted"]
+            changes[name] = {
+                "upserted": [obj for obj in upserted if obj is not None],
+                "deleted": [k for k, state in states[name].items() if state == "deleted"],
+                "renamed": renamed[name],
+            }
+        return current, changes
+
+
+STORE_USERS = open_store('users', USER_FILE, 'username')
+STORE_NOTES = open_store('notes', NOTES_FILE, 'id', hash_indexes=('date', 'task'), list_indexes=('tags',), sorted_indexes=('date',),
+                         records=NoteRecords(os.path.dirname(os.path.abspath(NOTES_FILE)) if NOTES_TEXT_ON_DISK else None))
+STORE_TAGS = open_store('tags', TAGS_FILE, 'name', hash_indexes=('parent',))
+TAG_TREE = TagTree(STORE_TAGS)
+DAILY_COUNTS = DailyCounts(STORE_NOTES)
+TASK_INDEX = TaskIndex(STORE_NOTES)
+SEARCH_INDEX = SearchIndex(STORE_NOTES)
+CHANGE_LOG = ChangeLog({"notes": STORE_NOTES, "tags": STORE_TAGS})
 
 # ------------------ Auth ------------------
 
-_TOKENS: Dict[str, Dict[str, Any]] = {}
-_TOKENS_LOCK = threading.RLock()
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class SessionStore:
+    """Bearer token sessions of this process.
+
+    Sessions are kept in a dict keyed by token, so authenticating is one lookup.
+    A per-user index (oldest first) makes revoking all sessions of a user and
+    evicting past SESSION_MAX_PER_USER independent of the total, and an expiry
+    heap lets a background thread drop expired sessions every
+    SESSION_SWEEP_SECONDS, so tokens that are never presented again don't pile up.
+    """
+    def __init__(self, max_per_user: int = SESSION_MAX_PER_USER, sweep_seconds: int = SESSION_SWEEP_SECONDS):
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._by_user: Dict[str, Dict[str, None]] = {}
+        # (expiry timestamp, token); entries of revoked tokens are skipped when popped
+        self._expiry: List[Tuple[float, str]] = []
+        self._max_per_user = max_per_user
+        self._sweep_seconds = sweep_seconds
+        self._thread: Optional[threading.Thread] = None
+
+    def create(self, username: str) -> Tuple[str, datetime]:
+        exp = datetime.now(timezone.utc) + timedelta(seconds=TOKEN_TTL_SECONDS)
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._sessions[token] = {"username": username, "exp": exp}
+            tokens = self._by_user.setdefault(username, {})
+            tokens[token] = None
+            while len(tokens) > self._max_per_user:
+                logger.info("SessionStore (create) Evicting oldest session of user=%s", username)
+                self._remove(next(iter(tokens)))
+            heapq.heappush(self._expiry, (exp.timestamp(), token))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="session-sweep", daemon=True)
+                self._thread.start()
+        return token, exp
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._sessions.get(token)
+
+    def revoke(self, token: str) -> bool:
+        with self._lock:
+            return self._remove(token)
+
+    def revoke_user(self, username: str) -> int:
+        with self._lock:
+            tokens = list(self._by_user.get(username, ()))
+            for token in tokens:
+                self._remove(token)
+            return len(tokens)
+
+    def _remove(self, token: str) -> bool:
+        session = self._sessions.pop(token, None)
+        if session is None:
+            return False
+        tokens = self._by_user[session["username"]]
+        del tokens[token]
+        if not tokens:
+            del self._by_user[session["username"]]
+        return True
+
+    def sweep(self, now: Optional[datetime] = None) -> int:
+        """Drop the sessions expired at `now`; returns how many."""
+        limit = (now or datetime.now(timezone.utc)).timestamp()
+        removed = 0
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= limit:
+                _, token = heapq.heappop(self._expiry)
+                removed += self._remove(token)
+            # revoked tokens leave their heap entries behind: rebuild once they dominate
+            if len(self._expiry) > 2 * len(self._sessions) + 64:
+                self._expiry = [(session["exp"].timestamp(), token) for token, session in self._sessions.items()]
+                heapq.heapify(self._expiry)
+        return removed
+
+    def _run(self):
+        while True:
+            time.sleep(self._sweep_seconds)
+            removed = self.sweep()
+            if removed:
+                logger.info("SessionStore (sweep) Removed %s expired sessions", removed)
+
+
+class SharedSessionStore(SessionStore):
+    """SessionStore kept in a shared store (STORE_SHARED=1), so every worker sees it.
+
+    Records are keyed by the SHA-256 of the token (the file never holds usable
+    tokens); the `username` and `exp` indexes serve per-user revocation and sweeping.
+    """
+    def __init__(self, store: "Store", max_per_user: int = SESSION_MAX_PER_USER,
+                 sweep_seconds: int = SESSION_SWEEP_SECONDS):
+        super().__init__(max_per_user, sweep_seconds)
+        self._store = store
+
+    def create(self, username: str) -> Tuple[str, datetime]:
+        exp = datetime.now(timezone.utc) + timedelta(seconds=TOKEN_TTL_SECONDS)
+        token = secrets.token_urlsafe(32)
+        with transaction(self._store):
+            self._store.add({"token": _token_key(token), "username": username, "exp": exp.isoformat()})
+            sessions = self._store.find_eq("username", username)
+            for stored in sorted(sessions, key=lambda s: s["exp"])[:max(0, len(sessions) - self._max_per_user)]:
+                logger.info("SharedSessionStore (create) Evicting oldest session of user=%s", username)
+                self._store.delete(stored["token"])
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="session-sweep", daemon=True)
+                self._thread.start()
+        return token, exp
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        stored = self._store.find_by_id(_token_key(token))
+        if stored is None:
+            return None
+        return {"username": stored["username"], "exp": datetime.fromisoformat(stored["exp"])}
+
+    def revoke(self, token: str) -> bool:
+        try:
+            self._store.delete(_token_key(token))
+        except KeyError:
+            return False
+        return True
+
+    def revoke_user(self, username: str) -> int:
+        with transaction(self._store):
+            sessions = self._store.find_eq("username", username)
+            for stored in sessions:
+                self._store.delete(stored["token"])
+        return len(sessions)
+
+    def sweep(self, now: Optional[datetime] = None) -> int:
+        with transaction(self._store):
+            expired = self._store.find_range("exp", "", (now or datetime.now(timezone.utc)).isoformat())
+            for stored in expired:
+                self._store.delete(stored["token"])
+        return len(expired)
+
+
+if STORE_SHARED:
+    SESSIONS: SessionStore = SharedSessionStore(open_store('sessions', SESSIONS_FILE, 'token',
+                                                           hash_indexes=('username',), sorted_indexes=('exp',)))
+else:
+    SESSIONS = SessionStore()
+
+class TokenBucketLimiter:
+    """Token buckets per key: `burst` attempts at once, refilled at `rate_per_minute`.
+
+    Only the `max_keys` most recently used buckets are kept; a forgotten key starts
+    again with a full bucket.
+    """
+    def __init__(self, rate_per_minute: float, burst: int, max_keys: int = 10000):
+        self._rate = rate_per_minute / 60
+        self._burst = burst
+        self._max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def acquire(self, key: str) -> float:
+        """Take one token for key; returns 0, or the seconds to wait when the bucket is empty."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self._burst, now))
+            tokens = min(self._burst, tokens + (now - last) * self._rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self._rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class PasswordVerifier:
+    """Runs password hash checks on a bounded thread pool, caching recent successes.
+
+    The KDF releases the GIL, so checks on the pool don't stall other requests;
+    at most `workers + queue` checks are admitted at once. The request thread
+    still waits for its check, so gunicorn runs threaded workers (`--worker-class
+    gthread --threads N` with N above `workers + queue`, see the Dockerfile): a
+    sync worker would serve nothing else meanwhile. Successful checks are
+    remembered for `cache_seconds` under an HMAC of (username, password, hash)
+    with a per-process key, so the cache never holds passwords and a password
+    change invalidates it.
+    """
+    def __init__(self, workers: int = SIGNIN_WORKERS, queue: int = SIGNIN_QUEUE,
+                 cache_seconds: int = SIGNIN_CACHE_SECONDS, max_cached: int = 10000):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kdf")
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._cache_seconds = cache_seconds
+        self._max_cached = max_cached
+        self._key = secrets.token_bytes(32)
+        self._lock = threading.Lock()
+        self._verified: "OrderedDict[bytes, float]" = OrderedDict()
+        self._method_id: Optional[str] = None
+
+    def _cache_key(self, username: str, password: str, password_hash: str) -> bytes:
+        message = "\0".join((username, password, password_hash)).encode("utf-8")
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def verify(self, username: str, password: str, password_hash: str) -> Optional[bool]:
+        """Check a password; None when too many checks are already running or queued."""
+        cache_key = self._cache_key(username, password, password_hash)
+        with self._lock:
+            expires = self._verified.get(cache_key)
+            if expires is not None and expires > time.monotonic():
+                return True
+        if not self._slots.acquire(blocking=False):
+            return None
+        try:
+            ok = self._pool.submit(check_password_hash, password_hash, password).result()
+        finally:
+            self._slots.release()
+        if ok and self._cache_seconds > 0:
+            with self._lock:
+                self._verified.pop(cache_key, None)
+                self._verified[cache_key] = time.monotonic() + self._cache_seconds
+                if len(self._verified) > self._max_cached:
+                    self._verified.popitem(last=False)
+        return ok
+
+    def hash(self, password: str) -> str:
+        """Hash a password with PASSWORD_HASH_METHOD, on the pool."""
+        return self._pool.submit(generate_password_hash, password, PASSWORD_HASH_METHOD).result()
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """Whether a stored hash was made with other parameters than PASSWORD_HASH_METHOD."""
+        if self._method_id is None:
+            # werkzeug fills in default parameters ("scrypt" -> "scrypt:32768:8:1")
+            self._method_id = self.hash("").split("$", 1)[0]
+        return password_hash.split("$", 1)[0] != self._method_id
+
+
+SIGNIN_USER_LIMITER = TokenBucketLimiter(SIGNIN_USER_RATE, SIGNIN_USER_BURST)
+SIGNIN_IP_LIMITER = TokenBucketLimiter(SIGNIN_IP_RATE, SIGNIN_IP_BURST)
+PASSWORD_VERIFIER = PasswordVerifier()
 
 def create_token(username: str) -> Tuple[str, datetime]:
     """Generate and store a new token for a user."""
-    exp = datetime.now(timezone.utc) + timedelta(seconds=TOKEN_TTL_SECONDS)
-    token = secrets.token_urlsafe(32)
-    with _TOKENS_LOCK:
-        _TOKENS[token] = {"username": username, "exp": exp}
-    logger.info(f"Issued new token for user={username}, expires={exp}")
+    token, exp = SESSIONS.create(username)
+    logger.info("Issued new token for user=%s, expires=%s", username, exp)
     return token, exp
 
+def get_session(token: str) -> Optional[Dict[str, Any]]:
+    """Return the session ({'username', 'exp'}) of a token, or None."""
+    return SESSIONS.get(token)
+
+def revoke_token(token: str) -> None:
+    """Forget a token; unknown tokens are ignored."""
+    SESSIONS.revoke(token)
+
 def _get_token_from_header() -> Optional[str]:
     """Extract Bearer token from Authorization header."""
     header = request.headers.get("Authorization", "")
@@ -188,20 +712,19 @@ def auth_required(fn):
             logger.warning("Missing or invalid Authorization header")
             abort(json_error(401, "Missing or invalid Authorization header. Use 'Bearer <token>'."))
 
-        with _TOKENS_LOCK:
-            session = _TOKENS.get(token)
-            if not session:
-                logger.warning("Invalid token provided")
-                abort(json_error(401, "Invalid token."))
-            if session["exp"] < datetime.now(timezone.utc):
-                logger.info("Expired token used, removing from store")
-                _TOKENS.pop(token, None)
-                abort(json_error(401, "Token expired."))
+        session = get_session(token)
+        if not session:
+            logger.warning("Invalid token provided")
+            abort(json_error(401, "Invalid token."))
+        if session["exp"] < datetime.now(timezone.utc):
+            logger.info("Expired token used, removing from store")
+            revoke_token(token)
+            abort(json_error(401, "Token expired."))
 
         # annotate request context with current user
         g.current_user = session["username"]
         g.current_token = token
-        logger.debug(f"Authenticated request by user={g.current_user}")
+        logger.debug("Authenticated request by user=%s", g.current_user)
         return fn(*args, **kwargs)
 
     return wrapper
@@ -214,7 +737,7 @@ def last_n_days(n=20):
 
 def categorize_tag(tag: str):
     """Return category name and clean tag string"""
-    logger.debug(f"Categorizing tag: {tag}")
+    logger.debug("Categorizing tag: %s", tag)
     if not tag:
         return None, None
     if tag.startswith("#"):
@@ -227,47 +750,49 @@ def categorize_tag(tag: str):
         return "Generic"
     raise ValueError("Invalid tag format")
 
-def find_tag_in_text(text: str):
-    """Return first found tag in text"""
-    return [word for word in text.split() if word.startswith(("#", "@", ">", "+"))]
-
-def extract_task_priority(text):
-    """Detect task priority and remove leading or space-preceded exclamation marks from text."""
-    cleaned = text
-    priority = None
-    duedate = None
-
-    # Regex: match '!!!', '!!', or '!' at start or after a space
-    match = re.search(r'(^|\s)(!{1,3})(\d\d-\d\d-\d\d|\d\d\d\d-\d\d-\d\d|\d\d-\d\d|today|tomorrow|week)?', text)
-    if match:
-        excl = match.group(2)
-        if excl == "!!!":
-            priority = "high"
-        elif excl == "!!":
-            priority = "mid"
-        elif excl == "!":
-            priority = "low"
-        # Remove only the matched exclamation marks (preserve others)
-        match_duedate = match.group(3)
-        if match_duedate:
-            if match_duedate == "today":
-                duedate = datetime.now().date().isoformat()[:10]
-            elif match_duedate == "tomorrow":
-                duedate = (datetime.now().date() + timedelta(days=1)).isoformat()[:10]
-            elif match_duedate == "week":
-                duedate = (datetime.now().date() + timedelta(days=7)).isoformat()[:10]
-            elif len(match_duedate) == 5:
-                duedate = f'{datetime.now().year}-{match_duedate}'
-            elif len(match_duedate) == 8:
-                duedate = datetime.strptime(match_duedate, '%y-%m-%d').isoformat()[:10]
-            elif len(match_duedate) == 10:
-                duedate = datetime.strptime(match_duedate, '%Y-%m-%d').isoformat()[:10]
-
-        cleaned = re.sub(r'(^|\s)(!{1,3})(\d\d-\d\d-\d\d|\d\d\d\d-\d\d-\d\d|\d\d-\d\d|today|tomorrow|week)?', lambda m: m.group(1), text, count=1)
-        # cleaned += ' ' + match.group(0).strip()
-    cleaned = cleaned.strip()
-
-    return priority, duedate, cleaned
+def note_order(note: Dict[str, Any]) -> Tuple[str, int, str]:
+    """Stable ordering (and pagination cursor) for notes."""
+    return note["date"], note["timestamp"], note["id"]
+
+def tag_order(tag: Dict[str, Any]) -> Tuple[str]:
+    """Stable ordering (and pagination cursor) for tags."""
+    return (tag["name"],)
+
+def project(obj: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """Keep only `fields` of obj; 'firstline' is the first line of the note text."""
+    out = {}
+    for field in fields:
+        if field == "firstline":
+            out[field] = obj.get("text", "").split("\n", 1)[0]
+        elif field in obj:
+            out[field] = obj[field]
+    return out
+
+def is_iso_date(value: Any) -> bool:
+    """Whether value is a 'YYYY-MM-DD' string of an existing day, the only form note dates take."""
+    if not isinstance(value, str) or len(value) != 10:
+        return False
+    try:
+        return date.fromisoformat(value).isoformat() == value
+    except ValueError:
+        return False
+
+def new_note(text: str, date: Optional[str] = None) -> Dict[str, Any]:
+    """Build a new note from raw text: tags, task priority and due date are parsed out of it."""
+    parsed = parse_note(text)
+    return {
+        "id": str(uuid.uuid4()),
+        "timestamp": int(time.time() * 1000),
+        "date": date or datetime.now().date().isoformat(),
+        "text": parsed.text,
+        "task": parsed.priority,
+        "tags": parsed.tags,
+        "duedate": parsed.duedate
+    }
+
+def new_tag(name: str) -> Dict[str, Any]:
+    """Tag object created the first time a tag appears in a note."""
+    return {"name": name, "category": categorize_tag(name), "treed": False, "parent": None}
 
 def compare_tags(tags_before, tags_after):
     tags_before = set(tags_before)
@@ -290,6 +815,128 @@ def json_error(status: int, message: str):
     response.status_code = status
     return response
 
+def query_limit(default: int) -> int:
+    """Parse the ?limit= query parameter, aborting 400 when out of range."""
+    limit = request.args.get("limit")
+    if limit is None:
+        return default
+    try:
+        limit = int(limit)
+        if not 1 <= limit <= MAX_PAGE_LIMIT:
+            raise ValueError
+    except ValueError:
+        abort(json_error(400, f"'limit' must be an integer between 1 and {MAX_PAGE_LIMIT}."))
+    return limit
+
+def query_fields() -> Optional[List[str]]:
+    """Parse the ?fields= projection query parameter."""
+    fields = request.args.get("fields")
+    if not fields:
+        return None
+    return [f.strip() for f in fields.split(",") if f.strip()]
+
+def encode_cursor(position: Tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple:
+    """Position encoded by encode_cursor(); aborts 400 on a malformed cursor."""
+    try:
+        return tuple(json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))))
+    except (ValueError, TypeError):
+        abort(json_error(400, "Invalid cursor."))
+
+def paginated(items: List[Dict[str, Any]], order: Callable[[Dict[str, Any]], Tuple]):
+    """jsonify a result list honoring the optional ?limit=, ?cursor= and ?fields= parameters.
+
+    With a limit or cursor the items are ordered by `order`; when more items follow,
+    the cursor of the next page is returned in the X-Next-Cursor header.
+    """
+    cursor = request.args.get("cursor")
+    fields = query_fields()
+    next_cursor = None
+    if "limit" in request.args or cursor is not None:
+        limit = query_limit(MAX_PAGE_LIMIT)
+        items = sorted(items, key=order)
+        start = 0
+        if cursor is not None:
+            after = decode_cursor(cursor)
+            try:
+                start = bisect.bisect_right(items, after, key=order)
+            except TypeError:
+                abort(json_error(400, "Invalid cursor."))
+        page = items[start:start + limit]
+        if start + limit < len(items):
+            next_cursor = encode_cursor(order(page[-1]))
+        items = page
+    if fields:
+        items = [project(item, fields) for item in items]
+    response = jsonify(items)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+# request path + query -> (etag, body, extra headers); LRU bounded by RESPONSE_CACHE_BYTES
+_RESPONSE_CACHE: "OrderedDict[str, Tuple[str, bytes, Dict[str, str]]]" = OrderedDict()
+_RESPONSE_CACHE_LOCK = threading.Lock()
+_response_cache_bytes = 0
+
+def cached_by_version(*stores: Store):
+    """Decorator for GET endpoints whose response only depends on `stores` and the request URL.
+
+    The response carries an ETag made of the store versions, answers a matching
+    If-None-Match with 304, and its serialized body is reused until a store changes.
+    """
+    from functools import wraps
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            global _response_cache_bytes
+            etag = "-".join(store.version for store in stores)
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+            key = request.full_path
+            with _RESPONSE_CACHE_LOCK:
+                hit = _RESPONSE_CACHE.get(key)
+                if hit is not None and hit[0] == etag:
+                    _RESPONSE_CACHE.move_to_end(key)
+            if hit is None or hit[0] != etag:
+                response = app.make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                extra = {h: response.headers[h] for h in ("X-Next-Cursor",) if h in response.headers}
+                hit = (etag, response.get_data(), extra)
+                with _RESPONSE_CACHE_LOCK:
+                    old = _RESPONSE_CACHE.pop(key, None)
+                    if old is not None:
+                        _response_cache_bytes -= len(old[1])
+                    if len(hit[1]) <= RESPONSE_CACHE_BYTES:
+                        _RESPONSE_CACHE[key] = hit
+                        _response_cache_bytes += len(hit[1])
+                    while _response_cache_bytes > RESPONSE_CACHE_BYTES:
+                        _response_cache_bytes -= len(_RESPONSE_CACHE.popitem(last=False)[1][1])
+            response = app.response_class(hit[1], mimetype="application/json", headers=hit[2])
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+        return wrapper
+    return decorator
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request_latency(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        METRICS.observe("journote_http_request_duration_seconds", (request.method, route, str(response.status_code)),
+                        time.perf_counter() - started)
+    return response
+
 @app.route("/")
 def api_serve_index():
     return send_from_directory("static", "index.html")
@@ -302,35 +949,35 @@ def health():
     logger.info("Health check requested")
     return jsonify({"status": "ok", "time": datetime.now(timezone.utc).astimezone(timezone.utc).isoformat()})
 
-def get_children(tag):
-    children = [x['name'] for x in STORE_TAGS.find_eq('parent', tag)]
-    for c in children:
-        children += get_children(c)
-    return children
+@app.route("/api/metrics", methods=["GET"])
+def api_metrics():
+    """Metrics of this process in the Prometheus text format; needs METRICS_TOKEN or a user token."""
+    def render():
+        return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+    token = _get_token_from_header()
+    if METRICS_TOKEN and token and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        return render()
+    return auth_required(render)()
 
 @app.route("/api/notes/<category>/<anonTag>", methods=["GET"])
 @auth_required
+@cached_by_version(STORE_NOTES, STORE_TAGS)
 def api_get_tagged_notes(category, anonTag):
-    logger.debug(f"Getting notes for category {category} and tag {anonTag}")
+    logger.debug("Getting notes for category %s and tag %s", category, anonTag)
     if category == "Journal":
         try:
             datetime.strptime(anonTag, "%Y-%m-%d")
         except ValueError:
             return jsonify({"error": "Invalid date format, expected YYYY-MM-DD"}), 400
-        return jsonify(STORE_NOTES.find_eq('date', anonTag))
+        return paginated(STORE_NOTES.find_eq('date', anonTag), note_order)
     if category not in CATEGORIES:
         return jsonify({"error": "Invalid category"}), 400
     tag = CATEGORIES[category] + anonTag
-    children = set(get_children(tag))
-    notes = STORE_NOTES.find_in_list('tags', tag)
-    for c in list(children):
-        notes += STORE_NOTES.find_in_list('tags', c)
-    logger.info(notes)
-    notes = {item['id']: item for item in notes}
-    notes = list(notes.values())
-    notes = sorted(notes, key=lambda x: (x["date"], x["timestamp"]))
+    notes = STORE_NOTES.find_in_list_any('tags', TAG_TREE.subtree(tag))
+    logger.debug("Found %s notes under tag %s", len(notes), tag)
+    notes.sort(key=note_order)
 
-    return jsonify(notes)
+    return paginated(notes, note_order)
 
 @app.route("/api/notes", methods=["POST"])
 @auth_required
@@ -338,23 +985,108 @@ def api_add_note():
     data = request.get_json()
     if not data or "text" not in data:
         return jsonify({"error": "Missing text"}), 400
-    tags = find_tag_in_text(data['text'])
-    priority, duedate, cleaned_text = extract_task_priority(data["text"])
-    note = {
-        "id": str(uuid.uuid4()),
-        "timestamp": int(time.time() * 1000),
-        "date": data.get("date") or datetime.now().date().isoformat(),
-        "text": cleaned_text,
-        "task": priority,
-        "tags": tags,
-        "duedate": duedate
-    }
-    STORE_NOTES.add(note)
-    for tag in tags:
-        if STORE_TAGS.find_by_id(tag) is None:
-            STORE_TAGS.add({"name": tag, "category": categorize_tag(tag), "treed": False, "parent": None})
+    if data.get("date") is not None and not is_iso_date(data["date"]):
+        return jsonify({"error": "Invalid date format, expected YYYY-MM-DD"}), 400
+    try:
+        note = new_note(data["text"], data.get("date"))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid due date in text: {e}"}), 400
+    with transaction(STORE_NOTES, STORE_TAGS):
+        STORE_NOTES.add(note)
+        for tag in note["tags"]:
+            if STORE_TAGS.find_by_id(tag) is None:
+                STORE_TAGS.add(new_tag(tag))
     return jsonify({"status": "created", "note": note}), 201
 
+# fields an import takes over from the exported note: check, description
+IMPORT_FIELDS: Dict[str, Tuple[Callable[[Any], bool], str]] = {
+    "id": (lambda v: isinstance(v, str) and v != "", "a non-empty string"),
+    "timestamp": (lambda v: isinstance(v, int) and not isinstance(v, bool), "an integer"),
+    "task": (lambda v: v is None or (isinstance(v, str) and v in TASK_PRIORITIES), f"null or one of {', '.join(TASK_PRIORITIES)}"),
+    "duedate": (lambda v: v is None or is_iso_date(v), "null or a YYYY-MM-DD date"),
+}
+
+def _import_batch(batch: List[Tuple[int, Any]], errors: List[Dict[str, Any]]) -> int:
+    """Add one batch of parsed NDJSON lines in a single transaction; returns how many were added."""
+    notes = []
+    for line_no, item in batch:
+        if not isinstance(item, dict) or not isinstance(item.get("text"), str):
+            errors.append({"line": line_no, "error": "Expected an object with a 'text' string"})
+            continue
+        if item.get("date") is not None and not is_iso_date(item["date"]):
+            errors.append({"line": line_no, "error": "Invalid date format, expected YYYY-MM-DD"})
+            continue
+        try:
+            note = new_note(item["text"], item.get("date"))
+        except ValueError as e:
+            errors.append({"line": line_no, "error": f"Invalid due date in text: {e}"})
+            continue
+        # exported notes carry their identity and parsed task fields: keep them
+        invalid = [field for field, (valid, _) in IMPORT_FIELDS.items() if field in item and not valid(item[field])]
+        if invalid:
+            errors.append({"line": line_no, "error": "; ".join(f"'{field}' must be {IMPORT_FIELDS[field][1]}" for field in invalid)})
+            continue
+        for field in IMPORT_FIELDS:
+            if field in item:
+                note[field] = item[field]
+        notes.append((line_no, note))
+    added = 0
+    # existing notes and tags are looked up under the transaction, as other requests may add them
+    with transaction(STORE_NOTES, STORE_TAGS):
+        for line_no, note in notes:
+            if STORE_NOTES.find_by_id(note["id"]) is not None:
+                errors.append({"line": line_no, "error": f"Note '{note['id']}' already exists"})
+                continue
+            STORE_NOTES.add(note)
+            added += 1
+            for tag in note["tags"]:
+                if STORE_TAGS.find_by_id(tag) is None:
+                    STORE_TAGS.add(new_tag(tag))
+    return added
+
+@app.route("/api/notes/import", methods=["POST"])
+@auth_required
+def api_import_notes():
+    """Bulk import from an NDJSON body (one note object per line), persisted once per batch."""
+    imported = 0
+    errors: List[Dict[str, Any]] = []
+    batch: List[Tuple[int, Any]] = []
+    for line_no, raw in enumerate(iter(request.stream.readline, b""), start=1):
+        if not raw.strip():
+            continue
+        try:
+            batch.append((line_no, json.loads(raw)))
+        except ValueError:
+            errors.append({"line": line_no, "error": "Invalid JSON"})
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            imported += _import_batch(batch, errors)
+            batch = []
+    if batch:
+        imported += _import_batch(batch, errors)
+    logger.info("api_import_notes: imported %s notes, %s rejected lines", imported, len(errors))
+    errors.sort(key=lambda error: error["line"])
+    return jsonify({"status": "imported", "imported": imported, "rejected": len(errors), "errors": errors[:IMPORT_MAX_ERRORS]})
+
+@app.route("/api/notes/export", methods=["GET"])
+@auth_required
+def api_export_notes():
+    """Stream every note as NDJSON."""
+    def generate():
+        for note in STORE_NOTES.iter_all():
+            yield json.dumps(note, ensure_ascii=False, default=json_default) + "\n"
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                    headers={"Content-Disposition": "attachment; filename=notes.ndjson"})
+
+@app.route("/api/notes/<note_id>", methods=["GET"])
+@auth_required
+@cached_by_version(STORE_NOTES)
+def api_get_note(note_id):
+    """One full note, for list views fetched with ?fields= to load texts lazily."""
+    note = STORE_NOTES.find_by_id(note_id)
+    if note is None:
+        return jsonify({"error": "Not found"}), 404
+    return jsonify(note)
+
 @app.route("/api/notes/<note_id>", methods=["DELETE"])
 @auth_required
 def api_delete_note(note_id):
@@ -371,75 +1103,175 @@ def api_patch_note(note_id):
     data = request.get_json()
     if not data or "text" not in data:
         return jsonify({"error": "Missing text"}), 400
+    if "date" in data and not is_iso_date(data["date"]):
+        return jsonify({"error": "Invalid date format, expected YYYY-MM-DD"}), 400
     note = STORE_NOTES.find_by_id(note_id)
     if not note:
         return jsonify({"error": "Not found"}), 404
+    note = dict(note)  # the stored object must stay untouched if the transaction rolls back
 
-    priority, duedate, cleaned_text = extract_task_priority(data["text"])
-    logger.info('priority')
-    logger.info(priority)
-    logger.info('duedate')
-    logger.info(duedate)
-    note["task"] = priority
-    note['duedate'] = duedate
+    try:
+        parsed = parse_note(data["text"])
+    except ValueError as e:
+        return jsonify({"error": f"Invalid due date in text: {e}"}), 400
+    logger.debug("Patched note %s: priority=%s duedate=%s", note_id, parsed.priority, parsed.duedate)
+    note["task"] = parsed.priority
+    note['duedate'] = parsed.duedate
 
     old_text = note["text"]
     old_tags = note["tags"]
-    note["text"] = cleaned_text
-    note["tags"] = find_tag_in_text(cleaned_text)
+    note["text"] = parsed.text
+    note["tags"] = parsed.tags
     note['date'] = data.get("date", note['date'])
-    STORE_NOTES.patch(note_id, note)
 
     added_tags, removed_tags = compare_tags(old_tags, note["tags"])
-    logger.info(f"Added tags: {added_tags}, Removed tags: {removed_tags}")
+    logger.info("Added tags: %s, Removed tags: %s", added_tags, removed_tags)
     any_new_tag = []
-    for tag in added_tags:
-        if STORE_TAGS.find_by_id(tag) is None:
-            any_new_tag.append(STORE_TAGS.add({"name": tag, "category": categorize_tag(tag), "treed": False, "parent": None}))
     any_removed_tag = []
-    for tag in removed_tags:
-        if len(STORE_NOTES.find_in_list('tags', tag)) == 0 and STORE_TAGS.find_by_id(tag)['content'] == '':
-            any_removed_tag.append(STORE_TAGS.delete(tag))
+    with transaction(STORE_NOTES, STORE_TAGS):
+        STORE_NOTES.patch(note_id, note)
+        for tag in added_tags:
+            if STORE_TAGS.find_by_id(tag) is None:
+                any_new_tag.append(STORE_TAGS.add(new_tag(tag)))
+        for tag in removed_tags:
+            stored_tag = STORE_TAGS.find_by_id(tag)
+            if len(STORE_NOTES.find_in_list('tags', tag)) == 0 and stored_tag is not None and stored_tag.get('content', '') == '':
+                any_removed_tag.append(STORE_TAGS.delete(tag))
     return jsonify({"status": "patched", "note": note, "new_tags": any_new_tag, "removed_tags": any_removed_tag})
 
 @app.route("/api/notes/<year>/<month>/count", methods=["GET"])
 @auth_required
+@cached_by_version(STORE_NOTES)
 def api_get_note_counts(year, month):
     try:
         year = int(year)
         month = int(month)
-        if month < 1 or month > 12:
+        if month < 1 or month > 12 or not date.min.year <= year <= date.max.year:
             raise ValueError
     except ValueError:
         return jsonify({"error": "Invalid year or month"}), 400
 
     from calendar import monthrange
     days_in_month = monthrange(year, month)[1]
-    date_counts = {f"{year}-{month:02d}-{day:02d}": 0 for day in range(1, days_in_month + 1)}
-    notes = STORE_NOTES.find_all()
-    for note in notes:
-        if note['date'] in date_counts:
-            date_counts[note['date']] += 1
+    date_counts, _ = DAILY_COUNTS.between(date(year, month, 1), date(year, month, days_in_month))
     return jsonify(date_counts)
 
+@app.route("/api/notes/counts", methods=["GET"])
+@auth_required
+@cached_by_version(STORE_NOTES)
+def api_get_note_counts_range():
+    """Per-day note and task counts for ?from=YYYY-MM-DD&to=YYYY-MM-DD (inclusive)."""
+    try:
+        first = date.fromisoformat(request.args["from"])
+        last = date.fromisoformat(request.args["to"])
+    except (KeyError, ValueError):
+        return jsonify({"error": "Expected 'from' and 'to' query parameters as YYYY-MM-DD"}), 400
+    if last < first or (last - first).days >= MAX_COUNT_RANGE_DAYS:
+        return jsonify({"error": f"Range must be ordered and span at most {MAX_COUNT_RANGE_DAYS} days"}), 400
+    note_counts, task_counts = DAILY_COUNTS.between(first, last)
+    return jsonify({"notes": note_counts, "tasks": task_counts})
+
+@app.route("/api/search", methods=["GET"])
+@auth_required
+@cached_by_version(STORE_NOTES)
+def api_search_notes():
+    """Full-text search over note text: ?q=<words>[&limit=N][&fields=...], best match first."""
+    query = request.args.get("q", "")
+    if not query.strip():
+        return jsonify({"error": "Missing 'q' query parameter"}), 400
+    notes = [STORE_NOTES.find_by_id(key) for key in SEARCH_INDEX.search(query, query_limit(SEARCH_DEFAULT_LIMIT))]
+    fields = query_fields()
+    if fields:
+        notes = [project(note, fields) for note in notes]
+    return jsonify(notes)
+
+@app.route("/api/changes", methods=["GET"])
+@auth_required
+def api_get_changes():
+    """Notes and tags changed after ?since=<rev>; `resync` asks the client to reload everything."""
+    since = request.args.get("since")
+    result = CHANGE_LOG.since(since) if since else None
+    if result is None:
+        return jsonify({"rev": CHANGE_LOG.revision(), "resync": True})
+    rev, changes = result
+    return jsonify({"rev": rev, "resync": False, **changes})
+
 @app.route("/api/tags", methods=["GET"])
 @auth_required
+@cached_by_version(STORE_TAGS)
 def api_get_tags():
-    a = jsonify(STORE_TAGS.find_all())
-    logger.info(a)
-    return a
+    return paginated(STORE_TAGS.find_all(), tag_order)
 
 @app.route("/api/tasks", methods=["GET"])
 @auth_required
+@cached_by_version(STORE_NOTES)
 def api_get_tasks():
-    filtered_notes = STORE_NOTES.find_any('task', ['low', 'mid', 'high'])
-    logger.info(f"api_get_tasks: Filtering notes for tasks, found {len(filtered_notes)} notes")
-    return jsonify(filtered_notes)
+    filtered_notes = STORE_NOTES.find_any('task', TASK_PRIORITIES)
+    logger.info("api_get_tasks: Filtering notes for tasks, found %s notes", len(filtered_notes))
+    return paginated(filtered_notes, note_order)
+
+def query_priorities() -> List[str]:
+    """Parse the optional ?priority=high,mid filter (all priorities by default)."""
+    priorities = [p for p in request.args.get("priority", "").split(",") if p] or list(TASK_PRIORITIES)
+    for priority in priorities:
+        if priority not in TASK_PRIORITIES:
+            abort(json_error(400, f"'priority' must be among {', '.join(TASK_PRIORITIES)}."))
+    return priorities
+
+def task_page(priorities: List[str], lower: str = "", upper: Optional[str] = MAX_KEY):
+    """jsonify one page of TASK_INDEX.query(), honoring ?limit= (default TASKS_DEFAULT_LIMIT), ?cursor= and ?fields=."""
+    limit = query_limit(TASKS_DEFAULT_LIMIT)
+    after = None
+    if "cursor" in request.args:
+        after = decode_cursor(request.args["cursor"])
+        if len(after) != 3 or not isinstance(after[0], str) or not isinstance(after[1], int) or not isinstance(after[2], str):
+            abort(json_error(400, "Invalid cursor."))
+    entries = TASK_INDEX.query(priorities, lower, upper, after, limit + 1)
+    notes = [STORE_NOTES.find_by_id(key) for _, _, key in entries[:limit]]
+    notes = [note for note in notes if note is not None]
+    fields = query_fields()
+    if fields:
+        notes = [project(note, fields) for note in notes]
+    response = jsonify(notes)
+    if len(entries) > limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(entries[limit - 1])
+    return response
+
+@app.route("/api/tasks/overdue", methods=["GET"])
+@auth_required
+def api_get_overdue_tasks():
+    """Tasks due before today, earliest due date first, then by priority (high first)."""
+    return task_page(query_priorities(), upper=date.today().isoformat())
+
+@app.route("/api/tasks/due", methods=["GET"])
+@auth_required
+@cached_by_version(STORE_NOTES)
+def api_get_tasks_due():
+    """Tasks due in ?from=YYYY-MM-DD&to=YYYY-MM-DD (inclusive), ordered by due date then priority."""
+    try:
+        first = date.fromisoformat(request.args["from"])
+        last = date.fromisoformat(request.args["to"])
+    except (KeyError, ValueError):
+        return jsonify({"error": "Expected 'from' and 'to' query parameters as YYYY-MM-DD"}), 400
+    if last < first:
+        return jsonify({"error": "Range must be ordered"}), 400
+    # exclusive upper bound; past 9999-12-31 every due date, but not the tasks without one
+    upper = (last + timedelta(days=1)).isoformat() if last < date.max else MAX_KEY
+    return task_page(query_priorities(), first.isoformat(), upper)
+
+@app.route("/api/tasks/priority/<priority>", methods=["GET"])
+@auth_required
+@cached_by_version(STORE_NOTES)
+def api_get_tasks_by_priority(priority):
+    """Tasks of one priority, by due date; tasks without a due date come last."""
+    if priority not in TASK_PRIORITIES:
+        return jsonify({"error": "Invalid priority"}), 400
+    return task_page([priority], upper=None)
 
 @app.route("/api/tags/<category>/<anonTag>", methods=["PATCH"])
 @auth_required
 def api_patch_tag_tree(category, anonTag):
-    logger.debug(f"api_patch_tag_tree: Patching tag {anonTag}")
+    logger.debug("api_patch_tag_tree: Patching tag %s", anonTag)
     tag = CATEGORIES[category] + anonTag
     data = request.get_json()
     if not data:
@@ -447,25 +1279,32 @@ def api_patch_tag_tree(category, anonTag):
     for required in ["treed", 'parent', 'content']:
         if required not in data:
             return jsonify({"error": "Missing '" + required + "' field"}), 400
-    ret = STORE_TAGS.patch(tag, {'treed': bool(data["treed"]), 'parent': data['parent'], 'content': data['content']} )
-    if 'rename' in data and data['rename'] != tag:
-        logger.info(f'renaming tag {tag} {data['rename']}')
-        STORE_TAGS.re_id(tag, data['rename'])
-        notes = STORE_NOTES.find_in_list('tags', tag)
-        for note in notes:
-            note['text'] = note['text'].replace(tag, data['rename'])
-            newtags = []
-            for item in note['tags']:
-                if item == tag:
-                    newtags.append(data['rename'])
-                else:
-                    newtags.append(item)
-            note['tags'] = newtags
-            STORE_NOTES.patch(note['id'], note)
-        tags = STORE_TAGS.find_eq('parent', tag)
-        for t in tags:
-            STORE_TAGS.patch(t['name'], {'parent': data['rename']})
-        ret['name'] = data['rename']
+    try:
+        with transaction(STORE_NOTES, STORE_TAGS):
+            ret = STORE_TAGS.patch(tag, {'treed': bool(data["treed"]), 'parent': data['parent'], 'content': data['content']} )
+            if 'rename' in data and data['rename'] != tag:
+                logger.info("renaming tag %s %s", tag, data['rename'])
+                STORE_TAGS.re_id(tag, data['rename'])
+                notes = STORE_NOTES.find_in_list('tags', tag)
+                for note in notes:
+                    note = dict(note)
+                    note['text'] = note['text'].replace(tag, data['rename'])
+                    newtags = []
+                    for item in note['tags']:
+                        if item == tag:
+                            newtags.append(data['rename'])
+                        else:
+                            newtags.append(item)
+                    note['tags'] = newtags
+                    STORE_NOTES.patch(note['id'], note)
+                tags = STORE_TAGS.find_eq('parent', tag)
+                for t in tags:
+                    STORE_TAGS.patch(t['name'], {'parent': data['rename']})
+                ret['name'] = data['rename']
+    except KeyError:
+        return jsonify({"error": "Not found"}), 404
+    except ValueError:
+        return jsonify({"error": f"Tag '{data['rename']}' already exists"}), 409
     return jsonify(ret)
 
 @app.post("/api/auth/signin")
@@ -478,25 +1317,88 @@ def signin():
     if not username or not password:
         logger.warning("Signin failed: missing username or password")
         abort(json_error(400, "Provide 'username' and 'password'."))
+    if not isinstance(username, str) or not isinstance(password, str):
+        # would otherwise reach the limiters and the password check as unhashable keys
+        logger.warning("Signin failed: username or password is not a string")
+        abort(json_error(400, "'username' and 'password' must be strings."))
+
+    wait = max(SIGNIN_IP_LIMITER.acquire(request.remote_addr or ""), SIGNIN_USER_LIMITER.acquire(username))
+    if wait:
+        logger.warning("Signin rate limited for user=%s ip=%s", username, request.remote_addr)
+        response = json_error(429, "Too many signin attempts, retry later.")
+        response.headers["Retry-After"] = str(math.ceil(wait))
+        abort(response)
 
     user = STORE_USERS.find_by_id(username)
-    if not user or not check_password_hash(user["password_hash"], password):
-        logger.warning(f"Signin failed for user={username}")
+    verified = PASSWORD_VERIFIER.verify(username, password, user["password_hash"]) if user else False
+    if verified is None:
+        logger.warning("Signin rejected: password verification pool is full")
+        response = json_error(503, "Signin is busy, retry later.")
+        response.headers["Retry-After"] = "1"
+        abort(response)
+    if not verified:
+        logger.warning("Signin failed for user=%s", username)
         abort(json_error(401, "Invalid credentials."))
+    if PASSWORD_VERIFIER.needs_rehash(user["password_hash"]):
+        logger.info("Upgrading password hash of user=%s to %s", username, PASSWORD_HASH_METHOD)
+        STORE_USERS.patch(username, {"password_hash": PASSWORD_VERIFIER.hash(password)})
 
     token, exp = create_token(username)
-    logger.info(f"User {username} signed in successfully")
+    logger.info("User %s signed in successfully", username)
     return jsonify({"token": token, "expires_at": exp.astimezone(timezone.utc).isoformat()}), 201
 
 @app.post("/api/auth/signout")
 @auth_required
 def signout():
     """Invalidate the current token."""
-    logger.info(f"User {g.current_user} signing out")
-    with _TOKENS_LOCK:
-        _TOKENS.pop(getattr(g, "current_token", ""), None)
+    logger.info("User %s signing out", g.current_user)
+    revoke_token(getattr(g, "current_token", ""))
     return jsonify({"status": "signed_out"}), 200
 
+@app.post("/api/auth/signout-all")
+@auth_required
+def signout_all():
+    """Invalidate every token of the current user."""
+    revoked = SESSIONS.revoke_user(g.current_user)
+    logger.info("User %s signed out %s sessions", g.current_user, revoked)
+    return jsonify({"status": "signed_out", "revoked": revoked}), 200
+
+
+@app.cli.command("set-password")
+@click.argument("username")
+@click.password_option()
+def set_password(username, password):
+    """Create a user, or change its password, hashing with PASSWORD_HASH_METHOD."""
+    password_hash = PASSWORD_VERIFIER.hash(password)
+    if STORE_USERS.find_by_id(username) is None:
+        STORE_USERS.add({"username": username, "password_hash": password_hash})
+        click.echo(f"User '{username}' created")
+    else:
+        STORE_USERS.patch(username, {"password_hash": password_hash})
+        click.echo(f"Password of '{username}' changed")
+
+@app.cli.command("migrate-sqlite")
+def migrate_sqlite():
+    """Copy users/tags/notes JSON files (journals included) into the SQLite database."""
+    if STORE_BACKEND != "sqlite":
+        raise click.UsageError("Run with STORE_BACKEND=sqlite (and SQLITE_PATH) to migrate.")
+    for store, file_path, name, search_key in ((STORE_USERS, USER_FILE, "users", "username"),
+                                               (STORE_TAGS, TAGS_FILE, "tags", "name"),
+                                               (STORE_NOTES, NOTES_FILE, "notes", "id")):
+        if not os.path.exists(file_path):
+            click.echo(f"{file_path}: not found, skipped")
+            continue
+        if store.find_all():
+            click.echo(f"{file_path}: table '{name}' is not empty, skipped")
+            continue
+        # read-only: the JSON files (journals included) are copied as they are, not compacted
+        source = FileBackedStore(f"{name}-migration", file_path, search_key, mode="snapshot", shared=False, read_only=True)
+        objs = source.find_all()
+        with store.batch():
+            for obj in objs:
+                store.add(obj)
+        click.echo(f"{file_path}: {len(objs)} objects copied into '{name}'")
+
 
 # ---------------------------
 # Dev entrypoint
@@ -0,0 +1,384 @@
+"""API load benchmark: synthetic corpus, timed scenarios, saved baselines.
+
+Generates a reproducible corpus (notes with tags from per-category tag trees,
+tasks and due dates over the last three years), starts the app on it, either
+in-process through the Flask test client or as a local gunicorn, and runs each
+scenario for a fixed number of requests, reporting p50/p99 latency and
+throughput. Results can be saved as a baseline and later runs compared to it.
+
+    python benchmarks/bench_api.py --notes 10k
+    python benchmarks/bench_api.py --notes 100k --target gunicorn --workers 2 --save-baseline base.json
+    python benchmarks/bench_api.py --notes 100k --target gunicorn --workers 2 --compare base.json
+
+Settings of the app go through --env (e.g. --env STORE_MODE=journal --env
+STORE_BACKEND=sqlite). Corpora are written to --data (a fresh temporary
+directory by default); an existing corpus of the same size and seed is reused.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+USERNAME = "bench"
+PASSWORD = "bench"
+PREFIXES = {"Projects": "#", "Persons": "@", "Events": ">", "Generic": "+"}
+WORDS = ("call meeting review draft plan fix ship write read check order book send update "
+         "prepare discuss follow-up budget design release notes idea lunch trip gym").split()
+SCENARIOS = ("add", "patch", "delete", "tag_tree", "counts", "tasks", "overdue", "rename")
+
+
+def parse_count(value):
+    """'10k' -> 10000, '1m' -> 1000000."""
+    value = value.lower()
+    factor = {"k": 1000, "m": 1000000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * factor)
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+# ------------------ Corpus ------------------
+
+def build_tags(rng, tags_per_category):
+    """Tag trees per category: roots with children and grandchildren."""
+    tags = []
+    for category, prefix in PREFIXES.items():
+        names = []
+        for i in range(tags_per_category):
+            name = f"{prefix}{category.lower()}{i}"
+            # a third are roots, the rest hang below an earlier tag of the category
+            parent = rng.choice(names) if names and rng.random() > 0.33 else None
+            tags.append({"name": name, "category": category, "treed": parent is not None, "parent": parent, "content": ""})
+            names.append(name)
+    return tags
+
+
+def build_note(rng, tag_names, today, days):
+    """A note with 0-3 tags (skewed towards popular ones), a task one time in five."""
+    note_tags = sorted({tag_names[min(int(rng.paretovariate(1.2)) - 1, len(tag_names) - 1)] if rng.random() < 0.5
+                        else rng.choice(tag_names) for _ in range(rng.randint(0, 3))})
+    words = rng.choices(WORDS, k=rng.randint(3, 14))
+    day = today - timedelta(days=rng.randrange(days))
+    task = duedate = None
+    if rng.random() < 0.2:
+        task = rng.choice(("low", "mid", "high"))
+        if rng.random() < 0.6:
+            duedate = (day + timedelta(days=rng.randint(-10, 30))).isoformat()
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "timestamp": int(time.mktime(day.timetuple()) * 1000) + rng.randrange(86400000),
+        "date": day.isoformat(),
+        "text": " ".join(words + note_tags),
+        "task": task,
+        "tags": note_tags,
+        "duedate": duedate,
+    }
+
+
+def generate_corpus(directory, notes, seed):
+    """Write users.json, tags.json and notes.json for `notes` notes; reuse a matching corpus."""
+    meta = {"notes": notes, "seed": seed}
+    meta_path = os.path.join(directory, "corpus.json")
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) == meta:
+                print(f"Reusing corpus in {directory}")
+                return
+    from werkzeug.security import generate_password_hash
+
+    print(f"Generating {notes} notes in {directory} ...")
+    rng = random.Random(seed)
+    tags = build_tags(rng, tags_per_category=max(20, int(notes ** 0.5) // 2))
+    tag_names = [t["name"] for t in tags]
+    today = date.today()
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            os.remove(path)
+    with open(os.path.join(directory, "users.json"), "w") as f:
+        json.dump([{"username": USERNAME, "password_hash": generate_password_hash(PASSWORD, "pbkdf2:sha256:1000")}], f)
+    with open(os.path.join(directory, "tags.json"), "w") as f:
+        json.dump(tags, f)
+    with open(os.path.join(directory, "notes.json"), "w") as f:
+        f.write("[")
+        for i in range(notes):
+            f.write(("," if i else "") + json.dumps(build_note(rng, tag_names, today, days=3 * 365)))
+        f.write("]")
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+
+
+def load_corpus(directory):
+    with open(os.path.join(directory, "tags.json")) as f:
+        tags = json.load(f)
+    with open(os.path.join(directory, "notes.json")) as f:
+        note_ids = [n["id"] for n in json.load(f)]
+    return tags, note_ids
+
+
+# ------------------ Targets ------------------
+
+class TestClientTarget:
+    """The app imported in this process, driven through Flask test clients."""
+    def __init__(self, directory, env):
+        os.environ.update(env)
+        os.chdir(directory)
+        sys.path.insert(0, REPO)
+        import app
+        self.app = app.app
+        if env.get("STORE_BACKEND") == "sqlite" and not app.STORE_NOTES.find_all():
+            self.app.test_cli_runner().invoke(args=["migrate-sqlite"])
+
+    def session(self):
+        client = self.app.test_client()
+
+        def send(method, path, body, headers):
+            response = client.open(path, method=method, json=body, headers=headers)
+            return response.status_code, response.get_data()
+        return send
+
+    def close(self):
+        pass
+
+
+class GunicornTarget:
+    """A local gunicorn serving the app, driven over HTTP."""
+    def __init__(self, directory, env, workers, threads):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        env = {**os.environ, "PYTHONPATH": REPO, **env}
+        if workers > 1:
+            # every worker must see the others' writes and sessions
+            env.setdefault("STORE_SHARED", "1")
+            env.setdefault("STORE_MODE", "journal")
+        if env.get("STORE_BACKEND") == "sqlite":
+            subprocess.run([sys.executable, "-m", "flask", "--app", "app", "migrate-sqlite"], cwd=directory, env=env, check=True)
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{self.port}", "--workers", str(workers),
+             "--worker-class", "gthread", "--threads", str(threads), "--log-level", "warning", "app:app"], cwd=directory, env=env)
+        deadline = time.monotonic() + 120
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=1).close()
+                break
+            except OSError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("gunicorn did not start")
+                time.sleep(0.2)
+
+    def session(self):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=120)
+
+        def send(method, path, body, headers):
+            payload = json.dumps(body).encode() if body is not None else None
+            if payload is not None:
+                headers = {**headers, "Content-Type": "application/json"}
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()  # the server closed an idle keep-alive connection
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+            return response.status, response.read()
+        return send
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait(30)
+
+
+# ------------------ Scenarios ------------------
+
+class Workload:
+    """Requests of each scenario, built from the corpus with a fixed seed."""
+    def __init__(self, tags, note_ids, seed):
+        self.rng = random.Random(seed + 1)
+        self.tags = tags
+        self.note_ids = note_ids
+        self.added = deque()
+        self.renamed = {}
+
+    def requests(self, scenario, count):
+        rng = self.rng
+        if scenario == "add":
+            for _ in range(count):
+                text = " ".join(rng.choices(WORDS, k=6) + [rng.choice(self.tags)["name"]])
+                yield "POST", "/api/notes", {"text": text + rng.choice(("", " !!", " !tomorrow"))}
+        elif scenario == "patch":
+            for _ in range(count):
+                yield "PATCH", f"/api/notes/{rng.choice(self.note_ids)}", {"text": " ".join(rng.choices(WORDS, k=8))}
+        elif scenario == "delete":
+            for _ in range(count):
+                note_id = self.added.popleft() if self.added else self.note_ids.pop()
+                yield "DELETE", f"/api/notes/{note_id}", None
+        elif scenario == "tag_tree":
+            roots = [t for t in self.tags if t["parent"] is None]
+            for _ in range(count):
+                tag = rng.choice(roots)
+                yield "GET", f"/api/notes/{tag['category']}/{tag['name'][1:]}?limit=100", None
+        elif scenario == "counts":
+            for _ in range(count):
+                first = date.today() - timedelta(days=rng.randrange(3 * 365))
+                yield "GET", f"/api/notes/counts?from={first.isoformat()}&to={(first + timedelta(days=41)).isoformat()}", None
+        elif scenario == "tasks":
+            for _ in range(count):
+                yield "GET", "/api/tasks?limit=100", None
+        elif scenario == "overdue":
+            for _ in range(count):
+                yield "GET", "/api/tasks/overdue?limit=100", None
+        elif scenario == "rename":
+            for _ in range(count):
+                tag = rng.choice(self.tags)
+                current = self.renamed.get(tag["name"], tag["name"])
+                target = tag["name"] if current != tag["name"] else tag["name"] + "-renamed"
+                self.renamed[tag["name"]] = target
+                body = {"treed": tag["treed"], "parent": tag["parent"], "content": "", "rename": target}
+                yield "PATCH", f"/api/tags/{tag['category']}/{current[1:]}", body
+
+    def record(self, scenario, status, body):
+        if scenario == "add" and status == 201:
+            self.added.append(json.loads(body)["note"]["id"])
+
+
+def run_scenario(target, workload, scenario, count, concurrency, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    requests = list(workload.requests(scenario, count))
+    queue = deque(requests)
+    lock = threading.Lock()
+    latencies, errors = [], []
+
+    def worker():
+        send = target.session()
+        while True:
+            with lock:
+                if not queue:
+                    return
+                method, path, body = queue.popleft()
+            start = time.perf_counter()
+            status, payload = send(method, path, body, headers)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if status >= 400:
+                    errors.append(status)
+                workload.record(scenario, status, payload)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "rps": round(len(latencies) / wall, 1) if wall else 0.0,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print changes against a baseline; returns the scenarios that regressed beyond tolerance (%)."""
+    regressions = []
+    print(f"\n{'scenario':<10}{'p50 Δ':>10}{'p99 Δ':>10}{'rps Δ':>10}")
+    for scenario, result in results.items():
+        base = baseline["results"].get(scenario)
+        if not base:
+            continue
+        deltas = {k: (result[k] - base[k]) / base[k] * 100 if base[k] else 0.0 for k in ("p50_ms", "p99_ms", "rps")}
+        regressed = deltas["p99_ms"] > tolerance or deltas["rps"] < -tolerance
+        if regressed:
+            regressions.append(scenario)
+        print(f"{scenario:<10}{deltas['p50_ms']:>+9.1f}%{deltas['p99_ms']:>+9.1f}%{deltas['rps']:>+9.1f}%"
+              + ("  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", default="10k", help="corpus size, e.g. 10k, 100k, 1m")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--data", help="corpus directory (default: a temporary one, removed afterwards)")
+    parser.add_argument("--target", choices=("client", "gunicorn"), default="client")
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=16, help="threads per gunicorn worker (gthread, as in the Dockerfile)")
+    parser.add_argument("--concurrency", type=int, default=1, help="client threads issuing requests")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario (rename: a quarter)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="app setting")
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--compare", metavar="FILE", help="baseline to compare to; exits 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="allowed p99/throughput change in %%")
+    args = parser.parse_args()
+
+    notes = parse_count(args.notes)
+    env = {"LOG_LEVEL": "WARNING", "SIGNIN_USER_BURST": "1000", "SIGNIN_IP_BURST": "1000"}
+    env.update(item.split("=", 1) for item in args.env)
+    directory = os.path.abspath(args.data) if args.data else tempfile.mkdtemp(prefix="journote-bench-")
+    generate_corpus(directory, notes, args.seed)
+    # run on a copy so the corpus stays pristine for the next run
+    workdir = tempfile.mkdtemp(prefix="journote-run-")
+    for name in ("users.json", "tags.json", "notes.json"):
+        shutil.copy(os.path.join(directory, name), workdir)
+    tags, note_ids = load_corpus(directory)
+
+    target = GunicornTarget(workdir, env, args.workers, args.threads) if args.target == "gunicorn" else TestClientTarget(workdir, env)
+    try:
+        status, body = target.session()("POST", "/api/auth/signin", {"username": USERNAME, "password": PASSWORD}, {})
+        if status != 201:
+            raise RuntimeError(f"signin failed: {status} {body[:200]!r}")
+        token = json.loads(body)["token"]
+        workload = Workload(tags, note_ids, args.seed)
+        results = {}
+        print(f"{'scenario':<10}{'requests':>9}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+        for scenario in args.scenarios.split(","):
+            count = max(1, args.requests // 4) if scenario == "rename" else args.requests
+            result = results[scenario] = run_scenario(target, workload, scenario, count, args.concurrency, token)
+            print(f"{scenario:<10}{result['requests']:>9}{result['errors']:>8}{result['p50_ms']:>10.2f}"
+                  f"{result['p99_ms']:>10.2f}{result['rps']:>10.1f}")
+    finally:
+        target.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+        if not args.data:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    meta = {"notes": notes, "seed": args.seed, "target": args.target, "workers": args.workers, "threads": args.threads,
+            "concurrency": args.concurrency, "env": env}
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["meta"] != meta:
+            print(f"warning: baseline was taken with different settings: {baseline['meta']}")
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
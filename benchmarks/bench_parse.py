@@ -0,0 +1,70 @@
+"""Micro-benchmark for note text parsing.
+
+Times note_parser.parse_note against the previous two-pass implementation
+(split for tags, then re.search + re.sub with an uncompiled pattern) on a
+few representative note shapes, after checking both give the same result.
+
+    python benchmarks/bench_parse.py [--number N]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from note_parser import parse_note  # noqa: E402
+
+SHAPES = {
+    "plain": "Bought groceries and walked the dog",
+    "tagged": "Lunch with @anna at >cafe-roma about +launch #work #food",
+    "task": "!! call the plumber about the kitchen sink #home",
+    "task-date": "#work +q3-report !!!2025-01-15 finish the draft and send to @bob",
+    "task-relative": "!tomorrow water plants @me",
+    "long": " ".join(["lorem ipsum dolor sit amet #tag%d" % i for i in range(40)]) + " !week wrap up",
+}
+
+
+def legacy_parse(text):
+    """The pre-note_parser code path, kept here as the comparison baseline."""
+    pattern = r'(^|\s)(!{1,3})(\d\d-\d\d-\d\d|\d\d\d\d-\d\d-\d\d|\d\d-\d\d|today|tomorrow|week)?'
+    priority = duedate = None
+    cleaned = text
+    match = re.search(pattern, text)
+    if match:
+        priority = {"!!!": "high", "!!": "mid", "!": "low"}[match.group(2)]
+        token = match.group(3)
+        if token == "today":
+            duedate = datetime.now().date().isoformat()[:10]
+        elif token == "tomorrow":
+            duedate = (datetime.now().date() + timedelta(days=1)).isoformat()[:10]
+        elif token == "week":
+            duedate = (datetime.now().date() + timedelta(days=7)).isoformat()[:10]
+        elif token and len(token) == 5:
+            duedate = f'{datetime.now().year}-{token}'
+        elif token and len(token) == 8:
+            duedate = datetime.strptime(token, '%y-%m-%d').isoformat()[:10]
+        elif token and len(token) == 10:
+            duedate = datetime.strptime(token, '%Y-%m-%d').isoformat()[:10]
+        cleaned = re.sub(pattern, lambda m: m.group(1), text, count=1)
+    cleaned = cleaned.strip()
+    tags = [word for word in cleaned.split() if word.startswith(("#", "@", ">", "+"))]
+    return cleaned, tags, priority, duedate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000, help="calls per shape and implementation")
+    args = parser.parse_args()
+
+    print(f"{'shape':<15}{'legacy ns/op':>14}{'parse_note ns/op':>18}{'speedup':>9}")
+    for name, text in SHAPES.items():
+        assert tuple(parse_note(text)) == legacy_parse(text), name
+        legacy = min(timeit.repeat(lambda: legacy_parse(text), number=args.number, repeat=3))
+        new = min(timeit.repeat(lambda: parse_note(text), number=args.number, repeat=3))
+        print(f"{name:<15}{legacy / args.number * 1e9:>14.0f}{new / args.number * 1e9:>18.0f}{legacy / new:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Process-local metrics in the Prometheus text format, served on /api/metrics.
+
+Modules declare their families on the shared ``METRICS`` registry at import
+time and record into it by name.
+"""
+import bisect
+import threading
+from typing import Any, Dict, Iterable, Tuple
+
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000)
+
+
+class Metrics:
+    """Process-local counters and histograms, rendered in the Prometheus text format.
+
+    Families are declared once with `counter()`/`histogram()`; series are then
+    addressed by their tuple of label values. With several workers each process
+    reports its own numbers.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # name -> (type, help, label names, buckets)
+        self._families: Dict[str, Tuple[str, str, Tuple[str, ...], Tuple[float, ...]]] = {}
+        # name -> label values -> counter value, or per-bucket counts (last one +Inf) followed by the sum
+        self._series: Dict[str, Dict[Tuple[str, ...], Any]] = {}
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...]):
+        self._families[name] = ("counter", help_text, labels, ())
+        self._series[name] = {}
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self._families[name] = ("histogram", help_text, labels, buckets)
+        self._series[name] = {}
+
+    def inc(self, name: str, labels: Tuple[str, ...], value: float = 1):
+        with self._lock:
+            series = self._series[name]
+            series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name: str, labels: Tuple[str, ...], value: float):
+        buckets = self._families[name][3]
+        index = bisect.bisect_left(buckets, value)
+        with self._lock:
+            series = self._series[name].get(labels)
+            if series is None:
+                series = self._series[name][labels] = [0] * (len(buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @staticmethod
+    def _labels(names: Iterable[str], values: Iterable[Any]) -> str:
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+        pairs = [f'{n}="{v}"' for n, v in zip(names, escaped)]
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> str:
+        with self._lock:
+            snapshot = {name: {labels: (list(v) if isinstance(v, list) else v) for labels, v in series.items()}
+                        for name, series in self._series.items()}
+        lines = []
+        for name, (kind, help_text, label_names, buckets) in self._families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(snapshot[name].items()):
+                if kind == "counter":
+                    lines.append(f"{name}{self._labels(label_names, labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ["+Inf"], value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._labels(label_names + ('le',), labels + (bound,))} {cumulative}")
+                lines.append(f"{name}_sum{self._labels(label_names, labels)} {value[-1]}")
+                lines.append(f"{name}_count{self._labels(label_names, labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
@@ -0,0 +1,63 @@
+"""Single-pass parser for note text.
+
+A note's text carries its own metadata: words starting with a tag prefix
+(``#topic``, ``@person``, ``>place``, ``+project``) are tags, and a run of
+one to three exclamation marks marks it as a task, optionally followed by a
+due date (``!!today``, ``!12-31``, ``!!!2025-01-15``, ``!week``...). The
+first task marker is removed from the stored text.
+
+``parse_note`` finds all of it with one precompiled regex search and one
+split, so the add/patch/import paths don't re-scan the text per field.
+"""
+from datetime import date, timedelta
+import re
+from typing import List, NamedTuple, Optional
+
+TAG_PREFIXES = ("#", "@", ">", "+")
+PRIORITIES = {"!!!": "high", "!!": "mid", "!": "low"}
+
+# '!!!', '!!' or '!' at start or after a whitespace, with an optional due date right after
+TASK_RE = re.compile(r'(^|\s)(!{1,3})(\d\d-\d\d-\d\d|\d\d\d\d-\d\d-\d\d|\d\d-\d\d|today|tomorrow|week)?')
+
+
+class ParsedNote(NamedTuple):
+    text: str
+    tags: List[str]
+    priority: Optional[str]
+    duedate: Optional[str]
+
+
+def parse_duedate(token: str, today: date) -> str:
+    """ISO date for a due date token; raises ValueError on an invalid calendar date."""
+    if token == "today":
+        return today.isoformat()
+    if token == "tomorrow":
+        return (today + timedelta(days=1)).isoformat()
+    if token == "week":
+        return (today + timedelta(days=7)).isoformat()
+    if len(token) == 5:  # mm-dd, current year
+        return f'{today.year}-{token}'
+    if len(token) == 8:  # yy-mm-dd, same pivot as strptime's %y
+        yy = int(token[:2])
+        return date(yy + (2000 if yy < 69 else 1900), int(token[3:5]), int(token[6:])).isoformat()
+    return date(int(token[:4]), int(token[5:7]), int(token[8:])).isoformat()
+
+
+def find_tags(text: str) -> List[str]:
+    return [word for word in text.split() if word.startswith(TAG_PREFIXES)]
+
+
+def parse_note(text: str, today: Optional[date] = None) -> ParsedNote:
+    """Cleaned text, tags, task priority and due date of a raw note text."""
+    priority = None
+    duedate = None
+    match = TASK_RE.search(text) if "!" in text else None
+    if match:
+        priority = PRIORITIES[match.group(2)]
+        token = match.group(3)
+        if token:
+            duedate = parse_duedate(token, today or date.today())
+        # remove only the matched marker, keep the whitespace before it
+        text = text[:match.start()] + match.group(1) + text[match.end():]
+    text = text.strip()
+    return ParsedNote(text, find_tags(text), priority, duedate)
@@ -0,0 +1,1471 @@
+"""Object stores behind the API: JSON files or SQLite tables.
+
+``FileBackedStore`` keeps a store's objects in memory, persisted to a JSON
+snapshot and optionally a journal of mutations; ``SqliteStore`` keeps them in a
+SQLite table. Both index chosen fields, notify listeners of every mutation,
+batch mutations with rollback and expose a version for conditional requests.
+``open_store`` picks the backend from STORE_BACKEND and ``transaction`` batches
+mutations across stores.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+import atexit
+import bisect
+from contextlib import ExitStack, contextmanager
+from datetime import date
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+try:
+    import fcntl
+except ImportError:  # not available on Windows; only needed with STORE_SHARED=1
+    fcntl = None
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from metrics import LATENCY_BUCKETS, METRICS, SIZE_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+# "snapshot": every mutation rewrites the whole JSON file.
+# "journal": mutations are appended to '<file>.journal' and folded into the
+# snapshot by a background compaction once JOURNAL_COMPACT_RECORDS accumulate.
+STORE_MODE = os.getenv("STORE_MODE", "snapshot")
+JOURNAL_COMPACT_RECORDS = int(os.getenv("JOURNAL_COMPACT_RECORDS", "1000"))
+# STORE_SHARED=1 lets several processes (gunicorn workers) serve the same files:
+# writes are serialized with an flock on '<file>.lock' and every access first
+# checks whether another process changed the files, replaying the new journal
+# records (journal mode) or reloading the snapshot. Sessions are then kept in
+# a shared store as well. Prefer STORE_MODE=journal with it, as a snapshot-mode
+# write forces every other worker into a full reload.
+STORE_SHARED = os.getenv("STORE_SHARED", "0") == "1"
+# "always": every mutation is on disk (fsynced) before the request returns.
+# "interval": mutations are buffered and flushed by a background writer every
+# STORE_FLUSH_INTERVAL_MS, or as soon as STORE_FLUSH_BATCH are pending, so a crash
+# loses at most that window. Shared stores always use "always".
+STORE_SYNC = os.getenv("STORE_SYNC", "always")
+STORE_FLUSH_INTERVAL_MS = int(os.getenv("STORE_FLUSH_INTERVAL_MS", "200"))
+STORE_FLUSH_BATCH = int(os.getenv("STORE_FLUSH_BATCH", "256"))
+# "json": FileBackedStore per JSON file; "sqlite": SqliteStore tables in SQLITE_PATH
+# (import existing JSON files once with `flask --app app migrate-sqlite`).
+STORE_BACKEND = os.getenv("STORE_BACKEND", "json")
+TEXT_REPACK_MIN_BYTES = 32 * 1024 * 1024  # dead text bytes tolerated before the scratch file is rewritten
+SQLITE_PATH = os.getenv("SQLITE_PATH", "journote.db")
+CHANGELOG_SIZE = int(os.getenv("CHANGELOG_SIZE", "10000"))
+CHANGES_PRUNE_EVERY = 1000  # commits to the SQLite change feed between prunes down to CHANGELOG_SIZE rows
+# Store versions of mutations not written out yet are per process: the boot id
+# keeps those of different workers (or of a restarted one) from ever matching.
+_BOOT_ID = uuid.uuid4().hex[:12]
+
+_MISSING = object()
+MAX_KEY = "\U0010ffff"  # sorts after every key: the open upper bound of a range
+
+METRICS.histogram("journote_store_scan_objects", "Objects visited by store lookups without an index.",
+                  ("store", "op"), SIZE_BUCKETS)
+METRICS.histogram("journote_store_write_seconds", "Duration of snapshot saves and journal appends.",
+                  ("store", "kind"), LATENCY_BUCKETS)
+METRICS.counter("journote_store_write_bytes_total", "Bytes written by snapshot saves and journal appends.",
+                ("store", "kind"))
+METRICS.histogram("journote_store_lock_wait_seconds", "Time spent waiting for a contended store lock.",
+                  ("store",), LATENCY_BUCKETS)
+
+
+def json_default(obj: Any) -> Any:
+    """`default` for json.dumps: read-only mappings (NoteRecord) serialize as dicts."""
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class _TimedRLock:
+    """Re-entrant lock recording how long contended acquisitions wait."""
+    def __init__(self, name: str):
+        self._lock = threading.RLock()
+        self._labels = (name,)
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(blocking=False):
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self._lock.acquire(timeout=timeout)
+        METRICS.observe("journote_store_lock_wait_seconds", self._labels, time.perf_counter() - start)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class _GroupCommitWriter:
+    """Background thread flushing the stores that buffer their writes (STORE_SYNC=interval)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dirty: Dict[Any, None] = {}
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # serializes flushes, so the flush at exit waits for one in progress
+        self._flush_lock = threading.Lock()
+
+    def mark_dirty(self, store, urgent: bool = False):
+        with self._lock:
+            self._dirty[store] = None
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+        if urgent:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(STORE_FLUSH_INTERVAL_MS / 1000)
+            self._wake.clear()
+            self.flush_all()
+
+    def flush_all(self):
+        with self._flush_lock:
+            with self._lock:
+                stores, self._dirty = list(self._dirty), {}
+            for store in stores:
+                try:
+                    store.flush()
+                except OSError:
+                    logger.exception("FileBackedStore[%s] (flush) Group commit failed, will retry", store._name)
+                    self.mark_dirty(store)
+
+
+_GROUP_COMMIT = _GroupCommitWriter()
+atexit.register(_GROUP_COMMIT.flush_all)
+
+
+class _TextBlobs:
+    """Anonymous append-only scratch file of UTF-8 texts, addressed by `offset << 32 | length`."""
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._file = tempfile.TemporaryFile(prefix="journote-texts-", dir=directory)
+        self._fd = self._file.fileno()
+        self.size = 0
+        self.dead = 0
+
+    def put(self, text: str) -> int:
+        data = text.encode("utf-8")
+        os.pwrite(self._fd, data, self.size)
+        ref = self.size << 32 | len(data)
+        self.size += len(data)
+        return ref
+
+    def get(self, ref: int) -> str:
+        return os.pread(self._fd, ref & 0xFFFFFFFF, ref >> 32).decode("utf-8")
+
+
+def _date_ordinal(value: str) -> Optional[int]:
+    """Ordinal of an ISO 'YYYY-MM-DD' string, None for anything else (kept verbatim)."""
+    if len(value) != 10:
+        return None
+    try:
+        day = date.fromisoformat(value)
+    except ValueError:
+        return None
+    return day.toordinal() if day.isoformat() == value else None
+
+
+class NoteRecord(Mapping):
+    """Compact, read-only note.
+
+    Slots instead of a per-note dict, tags/task/due date interned, the date kept
+    as an ordinal and, with a text file, the text left on disk until read. It
+    reads like the note dict it was made from; `dict(record)` materializes it.
+    Fields of unexpected type or name are kept as they are in `_extra`.
+    """
+    __slots__ = ("_id", "_timestamp", "_date", "_text", "_task", "_tags", "_duedate", "_blobs", "_extra")
+    FIELDS = ("id", "timestamp", "date", "text", "task", "tags", "duedate")
+
+    def __getitem__(self, field: str) -> Any:
+        getter = _NOTE_GETTERS.get(field)
+        value = getter(self) if getter is not None else _MISSING
+        if value is _MISSING:
+            if self._extra is not None and field in self._extra:
+                return self._extra[field]
+            raise KeyError(field)
+        return value
+
+    def __contains__(self, field: object) -> bool:
+        getter = _NOTE_GETTERS.get(field)
+        if getter is not None and getattr(self, "_" + field) is not _MISSING:
+            return True
+        return self._extra is not None and field in self._extra
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            if getattr(self, "_" + field) is not _MISSING:
+                yield field
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"NoteRecord({dict(self)!r})"
+
+    def _get_text(self):
+        if self._blobs is not None and self._text is not _MISSING:
+            return self._blobs.get(self._text)
+        return self._text
+
+
+_ISO_DATES: Dict[int, str] = {}  # ordinal -> 'YYYY-MM-DD', one string per distinct day
+
+def _iso_date(ordinal: int) -> str:
+    iso = _ISO_DATES.get(ordinal)
+    if iso is None:
+        iso = _ISO_DATES[ordinal] = date.fromordinal(ordinal).isoformat()
+    return iso
+
+
+_NOTE_GETTERS: Dict[str, Callable[[NoteRecord], Any]] = {
+    "id": lambda r: r._id,
+    "timestamp": lambda r: r._timestamp,
+    "date": lambda r: _iso_date(r._date) if type(r._date) is int else r._date,
+    "text": NoteRecord._get_text,
+    "task": lambda r: r._task,
+    "tags": lambda r: list(r._tags) if r._tags is not _MISSING else _MISSING,
+    "duedate": lambda r: r._duedate,
+}
+
+
+class NoteRecords:
+    """Packs note dicts into NoteRecords for FileBackedStore(records=...).
+
+    With `text_dir`, note texts are written to a _TextBlobs file in that
+    directory; the store reports replaced records with `discard()` and calls
+    `maintain()` after mutations, which rewrites the file once mostly dead.
+    """
+    def __init__(self, text_dir: Optional[str] = None):
+        self._blobs = _TextBlobs(text_dir) if text_dir is not None else None
+
+    def pack(self, obj: Mapping) -> NoteRecord:
+        if isinstance(obj, NoteRecord):
+            return obj
+        record = NoteRecord.__new__(NoteRecord)
+        extra = {k: v for k, v in obj.items() if k not in _NOTE_GETTERS}
+        record._id = obj.get("id", _MISSING)
+        record._timestamp = obj.get("timestamp", _MISSING)
+        record._date = record._text = record._task = record._tags = record._duedate = _MISSING
+        value = obj.get("date", _MISSING)
+        ordinal = _date_ordinal(value) if isinstance(value, str) else None
+        if ordinal is not None:
+            record._date = ordinal
+        elif value is None or value is _MISSING or isinstance(value, str):
+            record._date = value
+        else:
+            extra["date"] = value
+        for field in ("task", "duedate"):
+            value = obj.get(field, _MISSING)
+            if value is None or value is _MISSING:
+                setattr(record, "_" + field, value)
+            elif isinstance(value, str):
+                setattr(record, "_" + field, sys.intern(value))
+            else:
+                extra[field] = value
+        tags = obj.get("tags", _MISSING)
+        if isinstance(tags, list) and all(isinstance(t, str) for t in tags):
+            record._tags = tuple(sys.intern(t) for t in tags)
+        elif tags is not _MISSING:
+            extra["tags"] = tags
+        text = obj.get("text", _MISSING)
+        record._blobs = None
+        if isinstance(text, str) and self._blobs is not None:
+            record._text, record._blobs = self._blobs.put(text), self._blobs
+        elif isinstance(text, str) or text is _MISSING:
+            record._text = text
+        else:
+            extra["text"] = text
+        record._extra = extra or None
+        return record
+
+    def discard(self, record: NoteRecord):
+        """`record` left the store: its text becomes dead space."""
+        if record._blobs is not None and record._blobs is self._blobs:
+            self._blobs.dead += record._text & 0xFFFFFFFF
+
+    def maintain(self, data: Dict[str, NoteRecord]):
+        """Rewrite the text file when dead texts outweigh live ones. Call with the store lock held."""
+        blobs = self._blobs
+        if blobs is None or blobs.dead < max(TEXT_REPACK_MIN_BYTES, blobs.size - blobs.dead):
+            return
+        logger.info("NoteRecords (maintain) Rewriting text file, %s of %s bytes dead", blobs.dead, blobs.size)
+        self._blobs = _TextBlobs(blobs.directory)
+        for key, record in data.items():
+            # records already handed out keep reading the old file until they are dropped
+            moved = NoteRecord.__new__(NoteRecord)
+            for slot in NoteRecord.__slots__:
+                setattr(moved, slot, getattr(record, slot))
+            if record._blobs is not None:
+                moved._text, moved._blobs = self._blobs.put(record._get_text()), self._blobs
+            data[key] = moved
+
+class FileBackedStore:
+    """In-memory list of objects persisted to a JSON file, addressed by `search_key`.
+
+    Objects are kept in a dict keyed by `search_key`. Fields listed in
+    `hash_indexes` (equality), `list_indexes` (membership in a list field) and
+    `sorted_indexes` (ranges) are indexed and kept in sync on every mutation;
+    lookups on other fields fall back to a scan.
+
+    Stored objects are replaced, never changed in place: mutations store and
+    return copies, so callers can't reach into the store or its queued records.
+
+    A `read_only` store loads the snapshot and journals as they are, for one-off
+    copies (migrate-sqlite): nothing is compacted, truncated or written, and
+    mutations raise RuntimeError.
+    """
+    def __init__(self, name: str, file_path: str, search_key: str, mode: str = STORE_MODE,
+                 hash_indexes: Tuple[str, ...] = (), list_indexes: Tuple[str, ...] = (),
+                 sorted_indexes: Tuple[str, ...] = (), shared: bool = STORE_SHARED, sync: str = STORE_SYNC,
+                 records: Optional[NoteRecords] = None, read_only: bool = False):
+        if mode not in ("snapshot", "journal"):
+            raise ValueError(f"Invalid store mode '{mode}'")
+        if sync not in ("always", "interval"):
+            raise ValueError(f"Invalid store sync '{sync}'")
+        if shared and sync == "interval":
+            # buffered writes would be invisible to, and overwritten by, other processes
+            logger.warning("FileBackedStore[%s] (init) STORE_SYNC=interval is not supported for shared stores, using 'always'", name)
+            sync = "always"
+        if shared and fcntl is None:
+            raise RuntimeError("Shared stores need fcntl file locks, which this platform lacks")
+        self._name = name
+        self.file_path = file_path
+        self.journal_path = f"{file_path}.journal"
+        # a rotated journal being folded into the snapshot, then kept once folded (see compact)
+        self.compacting_path = f"{file_path}.journal.compacting"
+        self.compacted_path = f"{file_path}.journal.compacted"
+        self._search_key = search_key
+        self._mode = mode
+        self._read_only = read_only
+        self._lock = _TimedRLock(name)
+        self._data: Dict[str, Dict[str, Any]] = {}
+        # (kind, field) -> value -> ordered set of keys, for "hash" and "list" indexes
+        self._buckets: Dict[Tuple[str, str], Dict[Any, Dict[str, None]]] = {}
+        for field in hash_indexes:
+            self._buckets[("hash", field)] = {}
+        for field in list_indexes:
+            self._buckets[("list", field)] = {}
+        # field -> sorted list of (value, key)
+        self._sorted: Dict[str, List[Tuple[Any, str]]] = {field: [] for field in sorted_indexes}
+        # key -> indexed values in `_index_fields` order, so unindexing does not depend
+        # on the (mutable) stored object
+        self._index_fields = list(self._buckets) + [("sorted", field) for field in self._sorted]
+        self._indexed: Dict[str, Tuple[Any, ...]] = {}
+        self._listeners: List[Callable[[str, Optional[str], Optional[Dict[str, Any]]], None]] = []
+        self._version = 0
+        # (n, op, key, new key) of the last applied mutations, n counting like _version;
+        # op "reload" marks a gap. `_marks` maps versions seen or handed out to their n.
+        self._feed: deque = deque(maxlen=CHANGELOG_SIZE)
+        self._marks: "OrderedDict[str, int]" = OrderedDict()
+        self._journal = None
+        # id in the header record of the journal being read/appended, see _start_journal
+        self._journal_id: Optional[str] = None
+        # '.compacting' journal of the compaction running in this process, flocked for shared stores
+        self._compacting = None
+        self._journal_records = 0
+        self._journal_offset = 0
+        self._compact_needed = threading.Event()
+        self._shared = shared
+        self._lock_file = open(f"{file_path}.lock", "a") if shared else None
+        self._file_lock_depth = 0
+        self._batch_depth = 0
+        self._sync = sync
+        # packs stored objects into compact read-only records (see NoteRecords)
+        self._records = records
+        self._unflushed: List[Dict[str, Any]] = []
+        self._pending: List[Dict[str, Any]] = []
+        self._undo: List[Dict[str, Any]] = []
+        with self._lock, self._file_lock(fcntl.LOCK_EX if shared else None):
+            self._load()
+            self._seen = self._signature()
+            if not read_only:
+                if self._journal_records or os.path.exists(self.compacting_path):
+                    self.compact()
+                if self._mode == "journal" and self._journal_id is None:
+                    self._start_journal()
+                self._seen = self._signature()
+        if self._mode == "journal" and not read_only:
+            threading.Thread(target=self._compactor, name=f"compactor-{name}", daemon=True).start()
+        logger.info("FileBackedStore[%s] (init) Initialized with %s mode=%s sync=%s", self._name, self.file_path, self._mode, self._sync)
+
+    def _load(self):
+        """Load data from file or initialize default state, then replay the journal."""
+        if not os.path.exists(self.file_path):
+            logger.info("FileBackedStore[%s] (load) Data file '%s' not found in %s, initializing with default admin user", self._name, self.file_path, os.getcwd())
+            if not self._read_only:
+                self._save()
+        else:
+            logger.info("FileBackedStore[%s] (load) Loading data from %s", self._name, self.file_path)
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                for obj in json.load(f):
+                    if self._records is not None:
+                        obj = self._records.pack(obj)
+                    self._reindex(None, obj[self._search_key], obj)
+                    self._data[obj[self._search_key]] = obj
+        # a compaction that did not finish leaves its journal, which may not be in the snapshot yet
+        self._replay_file(self.compacting_path, 0)
+        self._journal_id = self._read_journal_id(self.journal_path)
+        self._journal_offset = 0
+        self._journal_records = self._replay()
+
+    def _reload(self):
+        """Drop the in-memory state and load it again from disk."""
+        self._data = {}
+        for buckets in self._buckets.values():
+            buckets.clear()
+        for entries in self._sorted.values():
+            entries.clear()
+        self._indexed.clear()
+        self._close_journal()
+        listeners, self._listeners = self._listeners, []
+        try:
+            self._load()
+        finally:
+            self._listeners = listeners
+        self._notify("reload", None, None)
+
+    def _replay(self) -> int:
+        """Apply the journal's records from `_journal_offset` on. Returns the number of records applied."""
+        if not os.path.exists(self.journal_path):
+            return 0
+        applied, self._journal_offset = self._replay_file(self.journal_path, self._journal_offset, self._journal_id)
+        logger.info("FileBackedStore[%s] (replay) Applied %s journal records", self._name, applied)
+        return applied
+
+    def _replay_file(self, path: str, offset: int, journal_id: Optional[str] = None) -> Tuple[int, int]:
+        """Apply the records of a journal file from `offset` on. Returns (records applied, end offset).
+
+        A record that cannot be decoded or lacks its newline (torn write from a
+        crash) ends the replay and the file is truncated to the last good record
+        (left as it is by a read-only store).
+        With the file's `journal_id`, the position after each record is marked as
+        a version (see changes_since).
+        """
+        if not os.path.exists(path):
+            return 0, offset
+        applied = 0
+        good_offset = offset
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unterminated record")
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning("FileBackedStore[%s] (replay) Discarding corrupt journal tail of %s at offset %s", self._name, path, good_offset)
+                    break
+                if record["op"] != "journal":
+                    self._apply(record)
+                    applied += 1
+                good_offset += len(line)
+                if journal_id is not None:
+                    self._mark(f"{journal_id}.{good_offset}")
+        if good_offset != os.path.getsize(path) and not self._read_only:
+            with open(path, "r+b") as f:
+                f.truncate(good_offset)
+        return applied, good_offset
+
+    @staticmethod
+    def _read_journal_id(path: str) -> Optional[str]:
+        """Id in the header record of a journal file; None without one (or without the file)."""
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+        except (FileNotFoundError, ValueError):
+            return None
+        return header.get("id") if isinstance(header, dict) and header.get("op") == "journal" else None
+
+    def _start_journal(self):
+        """Start an empty journal: just a header record with a new id.
+
+        The id tells processes following the journal whether the file they read
+        is still the current one, or was rotated by a compaction.
+        """
+        self._close_journal()
+        self._journal_id = uuid.uuid4().hex
+        line = (json.dumps({"op": "journal", "id": self._journal_id}) + "\n").encode("utf-8")
+        with open(self.journal_path, "wb") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_offset = len(line)
+        self._journal_records = 0
+        self._mark(f"{self._journal_id}.{self._journal_offset}")
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _save(self):
+        """Atomic write: write to temp file then replace."""
+        logger.debug("FileBackedStore[%s] (save) Persisting data to %s", self._name, self.file_path)
+        tmp_path = f"{self.file_path}.tmp"
+        self._dump(list(self._data.values()), tmp_path)
+        # snapshot mode versions are read off the file: give each snapshot its own
+        # mtime, also where file timestamps are coarser than the time between writes
+        try:
+            previous = os.stat(self.file_path).st_mtime_ns
+        except FileNotFoundError:
+            previous = 0
+        mtime = max(time.time_ns(), previous + 1)
+        os.utime(tmp_path, ns=(mtime, mtime))
+        os.replace(tmp_path, self.file_path)
+
+    def _dump(self, objs: List[Dict[str, Any]], tmp_path: str):
+        """Write objs to tmp_path as a snapshot and fsync it."""
+        start = time.perf_counter()
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(objs, f, ensure_ascii=False, indent=2, default=json_default)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        METRICS.observe("journote_store_write_seconds", (self._name, "snapshot"), time.perf_counter() - start)
+        METRICS.inc("journote_store_write_bytes_total", (self._name, "snapshot"), size)
+
+    def _append(self, record: Dict[str, Any]):
+        """Append one compact record to the journal and fsync it."""
+        if self._journal is None:
+            self._journal = open(self.journal_path, "ab")
+        start = time.perf_counter()
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=json_default) + "\n").encode("utf-8")
+        self._journal.write(line)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        METRICS.observe("journote_store_write_seconds", (self._name, "journal"), time.perf_counter() - start)
+        METRICS.inc("journote_store_write_bytes_total", (self._name, "journal"), len(line))
+        self._journal_offset += len(line)
+        self._journal_records += 1
+        self._mark(f"{self._journal_id}.{self._journal_offset}")
+        if self._journal_records >= JOURNAL_COMPACT_RECORDS:
+            self._compact_needed.set()
+
+    def _apply(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply a mutation record to the in-memory data.
+
+        Records carry the full resulting object ("put") or a removed key ("del"),
+        so replaying records already folded into the snapshot is harmless.
+        A "batch" record groups several records written by one batch().
+        """
+        op = record["op"]
+        if op == "batch":
+            for sub in record["ops"]:
+                self._apply(sub)
+            return None
+        if op == "delete":
+            key = record["key"]
+            if key not in self._data:
+                return None
+            self._reindex(key, None, None)
+            obj = self._data.pop(key)
+            if self._records is not None:
+                self._records.discard(obj)
+            self._notify(op, key, obj)
+            return obj
+        obj = record["obj"]
+        if self._records is not None:
+            obj = self._records.pack(obj)
+        key = obj[self._search_key]
+        old_key = record["key"] if op == "re_id" else key
+        if old_key != key and old_key in self._data:
+            self._reindex(old_key, key, obj)
+            replaced = self._data.pop(old_key)
+        else:
+            replaced = self._data.get(key)
+            self._reindex(key if replaced is not None else None, key, obj)
+        self._data[key] = obj
+        if self._records is not None:
+            if replaced is not None and replaced is not obj:
+                self._records.discard(replaced)
+            self._records.maintain(self._data)
+        self._notify(op, old_key, obj)
+        return obj
+
+    def add_listener(self, listener: Callable[[str, Optional[str], Optional[Dict[str, Any]]], None]):
+        """Register `listener(op, key, obj)`, called under the store lock after every applied mutation.
+
+        `op` is "add", "patch", "delete" or "re_id" (`key` is then the old key and
+        `obj` carries the new one). The listener first receives a "reload" event
+        with no key/object, on which it should rebuild its state from `find_all()`.
+        """
+        with self._reading():
+            self._listeners.append(listener)
+            listener("reload", None, None)
+
+    def _notify(self, op: str, key: Optional[str], obj: Optional[Dict[str, Any]]):
+        self._version += 1
+        self._feed.append((self._version, op, key, obj[self._search_key] if op == "re_id" else None))
+        for listener in self._listeners:
+            listener(op, key, obj)
+
+    def _mark(self, version: str):
+        """Remember that `version` is the current state, for changes_since."""
+        self._marks[version] = self._version
+        self._marks.move_to_end(version)
+        # the version before the oldest change retained in the feed, then one per change
+        if len(self._marks) > CHANGELOG_SIZE + 1:
+            self._marks.popitem(last=False)
+
+    @property
+    def version(self) -> str:
+        """Identity of the current state, the same in every process reading the same files.
+
+        Journal mode: the journal position; snapshot mode: the snapshot file.
+        Mutations not written out yet (open batch, STORE_SYNC=interval) make it
+        a per-process version.
+        """
+        with self._reading():
+            if self._pending or self._unflushed:
+                version = f"{_BOOT_ID}.{self._version}"
+            elif self._mode == "journal":
+                version = f"{self._journal_id}.{self._journal_offset}"
+            else:
+                st = os.stat(self.file_path)
+                version = f"{st.st_ino:x}.{st.st_size:x}.{st.st_mtime_ns:x}"
+            self._mark(version)
+            return version
+
+    def changes_since(self, version: str) -> Optional[List[Tuple[str, str, Optional[str]]]]:
+        """(op, key, new key) of the mutations applied after `version`, oldest first.
+
+        None when they are not all known: a version this process never reached
+        (in journal mode, the journal positions it replayed count), one older than
+        the last CHANGELOG_SIZE mutations, or one preceding a reload.
+        """
+        with self._reading():
+            since = self._marks.get(version)
+            if since is None or (self._feed and self._feed[0][0] > since + 1):
+                return None
+            changes = [(op, key, new_key) for n, op, key, new_key in self._feed if n > since]
+        if any(op == "reload" for op, _, _ in changes):
+            return None
+        return changes
+
+    def _index_values(self, obj: Dict[str, Any]) -> Tuple[Any, ...]:
+        return tuple(tuple(obj.get(field) or ()) if kind == "list" else obj.get(field) for kind, field in self._index_fields)
+
+    def _reindex(self, old_key: Optional[str], new_key: Optional[str], obj: Optional[Dict[str, Any]]):
+        """Move index entries from `old_key` to `new_key`/`obj`. Either side may be None (add/delete).
+
+        All or nothing: values that can't be indexed (unhashable, or not comparable
+        with the others of a sorted index) raise TypeError with the indexes unchanged.
+        """
+        old = self._indexed.get(old_key) if old_key is not None else None
+        new = self._index_values(obj) if obj is not None else None
+        if new is not None:
+            # bucket values must be hashable: check them all before touching any index
+            hash(tuple(value for (kind, _), value in zip(self._index_fields, new) if kind != "sorted"))
+        moved = old_key != new_key
+        done: List[Tuple[Callable[[str, str, str, Any], None], str, str, str, Any]] = []
+        try:
+            for i, (kind, field) in enumerate(self._index_fields):
+                if not moved and old is not None and new is not None and old[i] == new[i]:
+                    continue
+                if old is not None:
+                    self._index_remove(kind, field, old_key, old[i])
+                    done.append((self._index_insert, kind, field, old_key, old[i]))
+                if new is not None:
+                    self._index_insert(kind, field, new_key, new[i])
+                    done.append((self._index_remove, kind, field, new_key, new[i]))
+        except BaseException:
+            for undo, *args in reversed(done):
+                undo(*args)
+            raise
+        if old is not None:
+            del self._indexed[old_key]
+        if new is not None:
+            self._indexed[new_key] = new
+
+    def _index_insert(self, kind: str, field: str, key: str, value: Any):
+        if kind == "sorted":
+            if value is not None:
+                bisect.insort(self._sorted[field], (value, key))
+            return
+        buckets = self._buckets[(kind, field)]
+        for v in (value if kind == "list" else (value,)):
+            buckets.setdefault(v, {})[key] = None
+
+    def _index_remove(self, kind: str, field: str, key: str, value: Any):
+        if kind == "sorted":
+            if value is not None:
+                entries = self._sorted[field]
+                i = bisect.bisect_left(entries, (value, key))
+                if i < len(entries) and entries[i] == (value, key):
+                    del entries[i]
+            return
+        buckets = self._buckets[(kind, field)]
+        for v in (value if kind == "list" else (value,)):
+            bucket = buckets.get(v)
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del buckets[v]
+
+    def _commit(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply a mutation record, queued for persisting when the batch closes.
+
+        A mutation outside a batch is a batch of its own, so that it is rolled back
+        too when applying it fails (an index or a listener raising).
+        """
+        if not self._batch_depth:
+            with self.batch():
+                return self._commit(record)
+        self._undo.append(self._inverse(record))
+        self._pending.append(record)
+        return self._apply(record)
+
+    def _persist(self, records: List[Dict[str, Any]]):
+        if self._sync == "interval":
+            self._unflushed.extend(records)
+            _GROUP_COMMIT.mark_dirty(self, urgent=len(self._unflushed) >= STORE_FLUSH_BATCH)
+            return
+        self._write(records)
+
+    def _write(self, records: List[Dict[str, Any]]):
+        if self._mode == "journal":
+            self._append(records[0] if len(records) == 1 else {"op": "batch", "ops": records})
+        else:
+            self._save()
+
+    def _inverse(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Record undoing `record` against the current state."""
+        op = record["op"]
+        if op == "delete":
+            return {"op": "add", "obj": self._data[record["key"]]}
+        if op == "re_id":
+            return {"op": "re_id", "key": record["obj"][self._search_key], "obj": self._data[record["key"]]}
+        key = record["obj"][self._search_key]
+        if key not in self._data:
+            return {"op": "delete", "key": key}
+        return {"op": "patch", "obj": self._data[key]}
+
+    @contextmanager
+    def batch(self):
+        """Group mutations into one unit: persisted once on exit (a single journal record,
+        or a single snapshot write) and rolled back in memory if the block raises.
+
+        Nested batches join the outermost one.
+        """
+        with self._writing():
+            self._batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    logger.warning("FileBackedStore[%s] (batch) Rolling back %s mutations", self._name, len(self._undo))
+                    for record in reversed(self._undo):
+                        try:
+                            self._apply(record)
+                        except Exception:
+                            # data and indexes are restored before listeners run: keep undoing
+                            logger.exception("FileBackedStore[%s] (batch) Listener failed during rollback", self._name)
+                    self._undo, self._pending = [], []
+                raise
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                pending, self._undo, self._pending = self._pending, [], []
+                if pending:
+                    self._persist(pending)
+
+    def _signature(self) -> Optional[Tuple[Any, ...]]:
+        """Identity of the files on disk, to detect changes made by other processes."""
+        if not self._shared:
+            return None
+        signature = []
+        for path in (self.file_path, self.journal_path):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_ino, st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    @contextmanager
+    def _file_lock(self, operation: Optional[int]):
+        """Hold the cross-process flock (re-entrant); a no-op for non-shared stores."""
+        if operation is None or not self._shared or self._file_lock_depth:
+            self._file_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._file_lock_depth -= 1
+            return
+        fcntl.flock(self._lock_file, operation)
+        self._file_lock_depth += 1
+        try:
+            yield
+        finally:
+            self._file_lock_depth -= 1
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Catch up with changes made by other processes. Call with self._lock held."""
+        if not self._shared or self._signature() == self._seen:
+            return
+        with self._file_lock(fcntl.LOCK_SH):
+            current = self._signature()
+            if current == self._seen:
+                return
+            # mark as seen first: listeners re-enter the store while we reload
+            self._seen = current
+            if self._mode == "journal" and self._catch_up():
+                logger.debug("FileBackedStore[%s] (refresh) Replayed journal records of other processes", self._name)
+            else:
+                logger.info("FileBackedStore[%s] (refresh) Files changed by another process, reloading", self._name)
+                self._reload()
+            self._seen = self._signature()
+
+    def _catch_up(self) -> bool:
+        """Replay the journal records other processes appended since we last read it.
+
+        Compactions rotate the journal: the one we were reading is then followed
+        through '<journal>.compacted'/'.compacting' (oldest first) to the current
+        one. False when we fell further behind, or the journal was replaced by
+        other means: a full reload is then needed.
+        """
+        chain = [(path, self._read_journal_id(path)) for path in (self.compacted_path, self.compacting_path, self.journal_path)]
+        position = next((i for i, (_, journal_id) in enumerate(chain) if journal_id is not None and journal_id == self._journal_id), None)
+        if position is None or os.path.getsize(chain[position][0]) < self._journal_offset:
+            return False
+        if position < len(chain) - 1:
+            self._close_journal()  # appends go to the new journal
+            for path, journal_id in chain[position:-1]:
+                self._replay_file(path, self._journal_offset, journal_id)
+                self._journal_offset = 0
+            self._journal_id, self._journal_records = chain[-1][1], 0
+            if self._journal_id is None:
+                return False
+        self._journal_records += self._replay()
+        return True
+
+    @contextmanager
+    def _reading(self):
+        with self._lock:
+            self._refresh()
+            yield
+
+    @contextmanager
+    def _writing(self):
+        if self._read_only:
+            raise RuntimeError(f"FileBackedStore[{self._name}] is read-only")
+        with self._lock, self._file_lock(fcntl.LOCK_EX if self._shared else None):
+            self._refresh()
+            try:
+                yield
+            finally:
+                self._seen = self._signature()
+
+    def flush(self):
+        """Write out mutations buffered by STORE_SYNC=interval."""
+        with self._writing():
+            if not self._unflushed:
+                return
+            records, self._unflushed = self._unflushed, []
+            try:
+                self._write(records)
+            except BaseException:
+                self._unflushed = records + self._unflushed
+                raise
+
+    def compact(self):
+        """Fold the journal into a fresh snapshot.
+
+        Only the rotation holds the lock: the journal is renamed to
+        '<journal>.compacting', a new one is started, and the stored objects are
+        collected. Stored objects are replaced, never changed in place, so the
+        snapshot is serialized from them outside the lock while appends go on to
+        the new journal. The folded journal is then kept as '<journal>.compacted'
+        until the next compaction, for other processes still reading it.
+        """
+        with self._writing():
+            unfinished = os.path.exists(self.compacting_path)
+            if unfinished and self._compaction_running():
+                return
+            if self._journal_records == 0 and not unfinished:
+                return
+            logger.info("FileBackedStore[%s] (compact) Folding %s journal records into %s", self._name, self._journal_records, self.file_path)
+            if unfinished or self._mode == "snapshot":
+                # a compaction that crashed may not have written its snapshot: fold
+                # everything here, under the lock
+                self._save()
+                self._unflushed = []  # already part of the snapshot
+                self._close_journal()
+                for path in (self.compacting_path, self.compacted_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                if self._mode == "journal":
+                    if os.path.exists(self.journal_path):
+                        os.replace(self.journal_path, self.compacted_path)
+                    self._start_journal()
+                elif os.path.exists(self.journal_path):
+                    os.remove(self.journal_path)
+                    self._journal_records = 0
+                    self._journal_offset = 0
+                return
+            self._close_journal()
+            os.replace(self.journal_path, self.compacting_path)
+            self._compacting = open(self.compacting_path, "rb")
+            if self._shared:
+                fcntl.flock(self._compacting, fcntl.LOCK_EX)
+            self._start_journal()
+            objs = list(self._data.values())
+        tmp_path = f"{self.file_path}.{os.getpid()}.tmp"
+        try:
+            self._dump(objs, tmp_path)
+            with self._writing():
+                os.replace(tmp_path, self.file_path)
+                os.replace(self.compacting_path, self.compacted_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self._compacting.close()
+            self._compacting = None
+
+    def _compaction_running(self) -> bool:
+        """Whether the '.compacting' journal is being folded (here, or by another process
+        for shared stores) rather than left behind by a compaction that crashed."""
+        if self._compacting is not None:
+            return True
+        if not self._shared:
+            return False
+        with open(self.compacting_path, "rb") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+        return False
+
+    def _compactor(self):
+        while True:
+            self._compact_needed.wait()
+            self._compact_needed.clear()
+            try:
+                self.compact()
+            except OSError:
+                logger.exception("FileBackedStore[%s] (compact) Compaction failed", self._name)
+
+    def _scan(self, op: str) -> Iterable[Dict[str, Any]]:
+        """All objects, for a lookup on a field without an index."""
+        METRICS.observe("journote_store_scan_objects", (self._name, op), len(self._data))
+        return self._data.values()
+
+    def find_by_id(self, value_to_search: str) -> Optional[Dict[str, Any]]:
+        logger.debug("FileBackedStore[%s] (find_by_id) value_to_search='%s'", self._name, value_to_search)
+        with self._reading():
+            return self._data.get(value_to_search)
+
+    def find_eq(self, key_to_search: str, value_to_search: str) -> List[Dict[str, Any]]:
+        logger.debug("FileBackedStore[%s] (find_eq) key_to_search='%s', value_to_search='%s'", self._name, key_to_search, value_to_search)
+        with self._reading():
+            if ("hash", key_to_search) in self._buckets:
+                return [self._data[k] for k in self._buckets[("hash", key_to_search)].get(value_to_search, ())]
+            if key_to_search in self._sorted and value_to_search is not None:
+                return self.find_range(key_to_search, value_to_search, value_to_search)
+            return [u for u in self._scan("find_eq") if value_to_search == u[key_to_search]]
+
+    def find_in_list(self, key_to_search: str, value_to_search: str) -> List[Dict[str, Any]]:
+        logger.debug("FileBackedStore[%s] (find_in_list) key_to_search='%s', value_to_search='%s'", self._name, key_to_search, value_to_search)
+        with self._reading():
+            if ("list", key_to_search) in self._buckets:
+                return [self._data[k] for k in self._buckets[("list", key_to_search)].get(value_to_search, ())]
+            return [u for u in self._scan("find_in_list") if value_to_search in u[key_to_search]]
+
+
+    def find_in_list_any(self, key_to_search: str, values_to_search: Iterable[str]) -> List[Dict[str, Any]]:
+        """Objects whose list field contains at least one of the values, each returned once."""
+        logger.debug("FileBackedStore[%s] (find_in_list_any) key_to_search='%s', values_to_search=%s", self._name, key_to_search, values_to_search)
+        with self._reading():
+            if ("list", key_to_search) in self._buckets:
+                buckets = self._buckets[("list", key_to_search)]
+                keys = {k: None for v in values_to_search for k in buckets.get(v, ())}
+                return [self._data[k] for k in keys]
+            values = set(values_to_search)
+            return [u for u in self._scan("find_in_list_any") if values.intersection(u[key_to_search])]
+
+    def find_any(self, key_to_search: str, value_to_search: str) -> List[Dict[str, Any]]:
+        logger.debug("FileBackedStore[%s] (find_any) key_to_search='%s', value_to_search='%s'", self._name, key_to_search, value_to_search)
+        with self._reading():
+            if ("hash", key_to_search) in self._buckets:
+                buckets = self._buckets[("hash", key_to_search)]
+                return [self._data[k] for v in value_to_search for k in buckets.get(v, ())]
+            return [u for u in self._scan("find_any") if u.get(key_to_search) in value_to_search]
+
+    def find_range(self, key_to_search: str, lower: Any, upper: Any) -> List[Dict[str, Any]]:
+        """Objects with lower <= obj[key_to_search] <= upper, in ascending order. Needs a sorted index."""
+        logger.debug("FileBackedStore[%s] (find_range) key_to_search='%s', lower='%s', upper='%s'", self._name, key_to_search, lower, upper)
+        with self._reading():
+            entries = self._sorted[key_to_search]
+            lo = bisect.bisect_left(entries, (lower,))
+            hi = bisect.bisect_left(entries, (upper, MAX_KEY), lo)
+            return [self._data[k] for _, k in entries[lo:hi]]
+
+    def find_all(self) -> List[Dict[str, Any]]:
+        logger.debug("FileBackedStore[%s] (find_all)", self._name)
+        with self._reading():
+            return list(self._data.values())
+
+    def iter_all(self) -> Iterable[Dict[str, Any]]:
+        """Iterate over all objects without holding the lock while the caller consumes them.
+
+        Unlike SqliteStore.iter_all there is no `chunk_size`: the objects are already
+        in memory and never changed in place, so one list of them taken under the
+        lock is the whole cost, and the caller iterates a consistent snapshot.
+        """
+        yield from self.find_all()
+
+    def add(self, obj: Dict) -> Dict[str, Any]:
+        logger.info("FileBackedStore[%s] (add) '%s'", self._name, obj[self._search_key])
+        with self._writing():
+            if obj[self._search_key] in self._data:
+                logger.warning("FileBackedStore[%s] (add) Attempt to add existing object", self._name)
+                raise ValueError("Already exists.")
+            # user = {"username": username, "password_hash": generate_password_hash(password_plain)}
+            self._commit({"op": "add", "obj": dict(obj)})
+        return obj
+
+    def delete(self, key: str) -> None:
+        logger.info("FileBackedStore[%s] (delete) '%s'", self._name, key)
+        with self._writing():
+            if key not in self._data:
+                logger.warning("FileBackedStore[%s] (delete) id='%s' not found for delete", self._name, key)
+                raise KeyError("Object not found.")
+            return self._commit({"op": "delete", "key": key})
+
+    def patch(self, key: str, obj: Dict) -> Dict[str, Any]:
+        logger.info("FileBackedStore[%s] (patch) '%s'", self._name, key)
+        with self._writing():
+            if key not in self._data:
+                logger.warning("FileBackedStore[%s] (patch) id='%s' not found for patch", self._name, key)
+                raise KeyError("Object not found.")
+            current = dict(self._data[key])
+            for k, v in obj.items():
+                if k != self._search_key:
+                    current[k] = v
+            return dict(self._commit({"op": "patch", "obj": current}))
+
+    def re_id(self, old_key, new_key):
+        logger.info("FileBackedStore[%s] (re_id) '%s' '%s'", self._name, old_key, new_key)
+        with self._writing():
+            if old_key not in self._data:
+                logger.warning("FileBackedStore[%s] (re_id) id='%s' not found for patch", self._name, old_key)
+                raise KeyError("Object not found.")
+            if new_key in self._data:
+                logger.warning("FileBackedStore[%s] (re_id) id='%s' already exists", self._name, new_key)
+                raise ValueError("Already exists.")
+            obj = dict(self._data[old_key])
+            obj[self._search_key] = new_key
+            return dict(self._commit({"op": "re_id", "key": old_key, "obj": obj}))
+            
+
+class _SqliteDatabase:
+    """One connection per database file, shared by all its stores behind one lock.
+
+    Every mutation also goes into the `_changes` table, whose increasing ids order
+    the commits of all processes. Each process tails it from the last id it has
+    seen, so the listeners of its stores follow what the others commit key by key.
+    """
+    _instances: Dict[str, "_SqliteDatabase"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        if STORE_SYNC == "interval":
+            # WAL commits are no longer fsynced; checkpoints still are
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS _changes (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                          "store TEXT NOT NULL, op TEXT NOT NULL, key TEXT NOT NULL, new_key TEXT)")
+        # tells versions of this database from those of another one (or of a recreated file)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS _meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.execute("INSERT OR IGNORE INTO _meta (key, value) VALUES ('id', ?)", (uuid.uuid4().hex[:12],))
+        self.id = self.conn.execute("SELECT value FROM _meta WHERE key = 'id'").fetchone()[0]
+        self._depth = 0
+        self.stores: Dict[str, "SqliteStore"] = {}
+        # read before the last change: a commit in between is then polled again, not missed
+        self._data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        # id of the last change passed on to listeners
+        self.last_change = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM _changes").fetchone()[0]
+        # store -> id of its last change in the open transaction
+        self.written: Dict["SqliteStore", int] = {}
+        # store -> keys it notified listeners of inside the open transaction
+        self.touched: Dict["SqliteStore", Dict[str, None]] = {}
+
+    @classmethod
+    def open(cls, path: str) -> "_SqliteDatabase":
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    def poll(self):
+        """Pass the changes other processes committed since the last poll on to listeners. Call with self.lock held."""
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        self._data_version = version
+        rows = self.conn.execute("SELECT id, store, key, new_key FROM _changes WHERE id > ? ORDER BY id",
+                                 (self.last_change,)).fetchall()
+        if not rows:
+            return
+        missed = rows[0][0] != self.last_change + 1
+        self.last_change = rows[-1][0]
+        if missed:
+            # pruned before we read them: changes of unknown extent
+            logger.info("SqliteDatabase (poll) Fell behind the change feed of %s, reloading", self.path)
+            for store in self.stores.values():
+                store._change_id = self.last_change
+                store._notify("reload", None, None)
+            return
+        changed: Dict[str, Dict[str, None]] = {}
+        for change_id, name, key, new_key in rows:
+            if name in self.stores:
+                self.stores[name]._change_id = change_id
+            keys = changed.setdefault(name, {})
+            keys[key] = None
+            if new_key is not None:
+                keys[new_key] = None
+        for name, keys in changed.items():
+            store = self.stores.get(name)
+            if store is not None:
+                store._refresh_keys(keys)
+
+    def record(self, conn: sqlite3.Connection, store: "SqliteStore", op: str, key: str, new_key: Optional[str]):
+        """Add a mutation of the open transaction to the change feed."""
+        self.written[store] = conn.execute("INSERT INTO _changes (store, op, key, new_key) VALUES (?, ?, ?, ?)",
+                                           (store._name, op, key, new_key)).lastrowid
+        keys = self.touched.setdefault(store, {})
+        keys[key] = None
+        if new_key is not None:
+            keys[new_key] = None
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction; nested uses join the outermost one."""
+        with self.lock:
+            if self._depth == 0:
+                self.conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                if self._depth == 1:
+                    # others can't commit now: catch up so our changes follow theirs in the feed
+                    self.poll()
+                yield self.conn
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.conn.execute("ROLLBACK")
+                    touched, self.touched, self.written = self.touched, {}, {}
+                    for store, keys in touched.items():
+                        store._refresh_keys(keys)
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                written, self.written = self.written, {}
+                last = max(written.values(), default=self.last_change)
+                if last // CHANGES_PRUNE_EVERY != self.last_change // CHANGES_PRUNE_EVERY:
+                    self.conn.execute("DELETE FROM _changes WHERE id <= ?", (last - CHANGELOG_SIZE,))
+                self.conn.execute("COMMIT")
+                self.last_change = last
+                for store, change_id in written.items():
+                    store._change_id = change_id
+                self.touched = {}
+
+
+class SqliteStore:
+    """Same contract as FileBackedStore, kept in a SQLite database (WAL mode).
+
+    Each store is a table of JSON documents keyed by `search_key`. Fields in
+    `hash_indexes`/`sorted_indexes` are mirrored into indexed columns, and each
+    `list_indexes` field gets a (key, value) join table such as `notes_tags`.
+    Returned objects are fresh copies. Listeners learn of commits by other
+    processes through the change feed of the database: as "patch" events, or
+    "delete" events without an object.
+    """
+    def __init__(self, name: str, db_path: str, search_key: str,
+                 hash_indexes: Tuple[str, ...] = (), list_indexes: Tuple[str, ...] = (),
+                 sorted_indexes: Tuple[str, ...] = ()):
+        self._name = name
+        self.db_path = db_path
+        self._search_key = search_key
+        self._db = _SqliteDatabase.open(db_path)
+        self._lock = self._db.lock
+        self._columns = list(dict.fromkeys(hash_indexes + sorted_indexes))
+        self._lists = list(list_indexes)
+        self._listeners: List[Callable[[str, Optional[str], Optional[Dict[str, Any]]], None]] = []
+        self._version = 0
+        with self._db.transaction() as conn:
+            columns = "".join(f', "f_{field}"' for field in self._columns)
+            conn.execute(f'CREATE TABLE IF NOT EXISTS "{name}" (key TEXT PRIMARY KEY, doc TEXT NOT NULL{columns})')
+            existing = {row[1] for row in conn.execute(f'PRAGMA table_info("{name}")')}
+            for field in self._columns:
+                if f"f_{field}" not in existing:
+                    # index declared after the table was created: add the column and backfill it
+                    conn.execute(f'ALTER TABLE "{name}" ADD COLUMN "f_{field}"')
+                    conn.execute(f'UPDATE "{name}" SET "f_{field}" = json_extract(doc, ?)', (f"$.{field}",))
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}_f_{field}" ON "{name}" ("f_{field}")')
+            for field in self._lists:
+                conn.execute(f'CREATE TABLE IF NOT EXISTS "{name}_{field}" (key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (value, key)) WITHOUT ROWID')
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}_{field}_key" ON "{name}_{field}" (key)')
+            # id of the last change of this store, its version
+            self._change_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM _changes WHERE store = ?", (name,)).fetchone()[0]
+            self._db.stores[name] = self
+        logger.info("SqliteStore[%s] (init) Initialized with %s", self._name, self.db_path)
+
+    @contextmanager
+    def _reading(self):
+        """Hold the database lock; pass on to listeners what other processes committed."""
+        with self._lock:
+            self._db.poll()
+            yield self._db.conn
+
+    def _refresh_keys(self, keys: Iterable[str]):
+        """Tell listeners the current state of `keys`, changed behind their back."""
+        for key in keys:
+            row = self._db.conn.execute(f'SELECT doc FROM "{self._name}" WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self._notify("delete", key, None)
+            else:
+                self._notify("patch", key, json.loads(row[0]))
+
+    def _query(self, sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+        with self._reading() as conn:
+            return [json.loads(doc) for (doc,) in conn.execute(sql, tuple(params))]
+
+    def _put(self, conn: sqlite3.Connection, obj: Dict[str, Any], old_key: Optional[str]):
+        """Insert obj (old_key None) or overwrite the row currently keyed by old_key."""
+        key = obj[self._search_key]
+        values = [key, json.dumps(obj, ensure_ascii=False, separators=(",", ":"))] + [obj.get(f) for f in self._columns]
+        columns = ["key", "doc"] + [f'"f_{f}"' for f in self._columns]
+        if old_key is None:
+            conn.execute(f'INSERT INTO "{self._name}" ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})', values)
+        else:
+            conn.execute(f'UPDATE "{self._name}" SET {", ".join(c + " = ?" for c in columns)} WHERE key = ?', values + [old_key])
+        for field in self._lists:
+            conn.execute(f'DELETE FROM "{self._name}_{field}" WHERE key = ?', (old_key if old_key is not None else key,))
+            conn.executemany(f'INSERT OR IGNORE INTO "{self._name}_{field}" (key, value) VALUES (?, ?)',
+                             [(key, value) for value in obj.get(field) or ()])
+
+    def add_listener(self, listener: Callable[[str, Optional[str], Optional[Dict[str, Any]]], None]):
+        """See FileBackedStore.add_listener."""
+        with self._reading():
+            self._listeners.append(listener)
+            listener("reload", None, None)
+
+    def _notify(self, op: str, key: Optional[str], obj: Optional[Dict[str, Any]]):
+        self._version += 1
+        for listener in self._listeners:
+            listener(op, key, obj)
+
+    def _changed(self, conn: sqlite3.Connection, op: str, key: str, obj: Dict[str, Any]):
+        """Record a mutation in the change feed, then tell listeners."""
+        self._db.record(conn, self, op, key, obj[self._search_key] if op == "re_id" else None)
+        self._notify(op, key, obj)
+
+    @property
+    def version(self) -> str:
+        """Id of the store's last change in the change feed, the same in every process.
+
+        Changes of the open transaction make it a per-process version until it commits.
+        """
+        with self._reading():
+            if self in self._db.written:
+                return f"{_BOOT_ID}.{self._version}"
+            return f"{self._db.id}.{self._change_id}"
+
+    def changes_since(self, version: str) -> Optional[List[Tuple[str, str, Optional[str]]]]:
+        """See FileBackedStore.changes_since; read from the change feed of the database."""
+        db_id, _, number = version.partition(".")
+        with self._reading() as conn:
+            if db_id != self._db.id or not number.isdigit() or int(number) > self._db.last_change:
+                return None
+            since = int(number)
+            if since == self._change_id:
+                return []
+            first = conn.execute("SELECT MIN(id) FROM _changes").fetchone()[0]
+            if first is None or first > since + 1:
+                return None  # changes of this store may have been pruned
+            return [tuple(row) for row in conn.execute(
+                "SELECT op, key, new_key FROM _changes WHERE store = ? AND id > ? ORDER BY id", (self._name, since))]
+
+    @contextmanager
+    def batch(self):
+        """Group mutations into one SQLite transaction (shared by all stores of the database).
+
+        On error the transaction is rolled back and listeners are told the restored
+        state of the keys it changed.
+        """
+        with self._reading(), self._db.transaction():
+            yield self
+
+    def compact(self):
+        """Checkpoint the WAL into the main database file."""
+        with self._lock:
+            self._db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _scan(self, op: str) -> List[Dict[str, Any]]:
+        """All objects, for a lookup on a field without an indexed column."""
+        objs = self.find_all()
+        METRICS.observe("journote_store_scan_objects", (self._name, op), len(objs))
+        return objs
+
+    def find_by_id(self, value_to_search: str) -> Optional[Dict[str, Any]]:
+        logger.debug("SqliteStore[%s] (find_by_id) value_to_search='%s'", self._name, value_to_search)
+        found = self._query(f'SELECT doc FROM "{self._name}" WHERE key = ?', (value_to_search,))
+        return found[0] if found else None
+
+    def find_eq(self, key_to_search: str, value_to_search: str) -> List[Dict[str, Any]]:
+        logger.debug("SqliteStore[%s] (find_eq) key_to_search='%s', value_to_search='%s'", self._name, key_to_search, value_to_search)
+        if key_to_search in self._columns:
+            return self._query(f'SELECT doc FROM "{self._name}" WHERE "f_{key_to_search}" IS ? ORDER BY rowid', (value_to_search,))
+        return [u for u in self._scan("find_eq") if value_to_search == u[key_to_search]]
+
+    def find_in_list(self, key_to_search: str, value_to_search: str) -> List[Dict[str, Any]]:
+        logger.debug("SqliteStore[%s] (find_in_list) key_to_search='%s', value_to_search='%s'", self._name, key_to_search, value_to_search)
+        return self.find_in_list_any(key_to_search, (value_to_search,))
+
+    def find_in_list_any(self, key_to_search: str, values_to_search: Iterable[str]) -> List[Dict[str, Any]]:
+        """Objects whose list field contains at least one of the values, each returned once."""
+        logger.debug("SqliteStore[%s] (find_in_list_any) key_to_search='%s', values_to_search=%s", self._name, key_to_search, values_to_search)
+        values = list(values_to_search)
+        if key_to_search in self._lists:
+            return self._query(f'SELECT doc FROM "{self._name}" WHERE key IN '
+                               f'(SELECT key FROM "{self._name}_{key_to_search}" WHERE value IN ({", ".join("?" * len(values))})) ORDER BY rowid', values)
+        return [u for u in self._scan("find_in_list_any") if set(values).intersection(u[key_to_search])]
+
+    def find_any(self, key_to_search: str, value_to_search: str) -> List[Dict[str, Any]]:
+        logger.debug("SqliteStore[%s] (find_any) key_to_search='%s', value_to_search='%s'", self._name, key_to_search, value_to_search)
+        if key_to_search in self._columns:
+            values = [v for v in value_to_search if v is not None]
+            condition = f'"f_{key_to_search}" IN ({", ".join("?" * len(values))})'
+            if len(values) != len(value_to_search):
+                condition += f' OR "f_{key_to_search}" IS NULL'
+            return self._query(f'SELECT doc FROM "{self._name}" WHERE {condition} ORDER BY rowid', values)
+        return [u for u in self._scan("find_any") if u.get(key_to_search) in value_to_search]
+
+    def find_range(self, key_to_search: str, lower: Any, upper: Any) -> List[Dict[str, Any]]:
+        """Objects with lower <= obj[key_to_search] <= upper, in ascending order."""
+        logger.debug("SqliteStore[%s] (find_range) key_to_search='%s', lower='%s', upper='%s'", self._name, key_to_search, lower, upper)
+        return self._query(f'SELECT doc FROM "{self._name}" WHERE "f_{key_to_search}" BETWEEN ? AND ? '
+                           f'ORDER BY "f_{key_to_search}", key', (lower, upper))
+
+    def find_all(self) -> List[Dict[str, Any]]:
+        logger.debug("SqliteStore[%s] (find_all)", self._name)
+        return self._query(f'SELECT doc FROM "{self._name}" ORDER BY rowid')
+
+    def iter_all(self, chunk_size: int = 500) -> Iterable[Dict[str, Any]]:
+        """Iterate over all objects, loading `chunk_size` rows per query."""
+        last = 0
+        while True:
+            with self._reading() as conn:
+                rows = conn.execute(f'SELECT rowid, doc FROM "{self._name}" WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                                    (last, chunk_size)).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            for _, doc in rows:
+                yield json.loads(doc)
+
+    def _exists(self, conn: sqlite3.Connection, key: str) -> bool:
+        return conn.execute(f'SELECT 1 FROM "{self._name}" WHERE key = ?', (key,)).fetchone() is not None
+
+    def add(self, obj: Dict) -> Dict[str, Any]:
+        logger.info("SqliteStore[%s] (add) '%s'", self._name, obj[self._search_key])
+        with self._reading(), self._db.transaction() as conn:
+            if self._exists(conn, obj[self._search_key]):
+                logger.warning("SqliteStore[%s] (add) Attempt to add existing object", self._name)
+                raise ValueError("Already exists.")
+            self._put(conn, obj, None)
+            self._changed(conn, "add", obj[self._search_key], obj)
+        return obj
+
+    def delete(self, key: str) -> Dict[str, Any]:
+        logger.info("SqliteStore[%s] (delete) '%s'", self._name, key)
+        with self._reading(), self._db.transaction() as conn:
+            elem = self.find_by_id(key)
+            if elem is None:
+                logger.warning("SqliteStore[%s] (delete) id='%s' not found for delete", self._name, key)
+                raise KeyError("Object not found.")
+            conn.execute(f'DELETE FROM "{self._name}" WHERE key = ?', (key,))
+            for field in self._lists:
+                conn.execute(f'DELETE FROM "{self._name}_{field}" WHERE key = ?', (key,))
+            self._changed(conn, "delete", key, elem)
+            return elem
+
+    def patch(self, key: str, obj: Dict) -> Dict[str, Any]:
+        logger.info("SqliteStore[%s] (patch) '%s'", self._name, key)
+        with self._reading(), self._db.transaction() as conn:
+            current = self.find_by_id(key)
+            if current is None:
+                logger.warning("SqliteStore[%s] (patch) id='%s' not found for patch", self._name, key)
+                raise KeyError("Object not found.")
+            for k, v in obj.items():
+                if k != self._search_key:
+                    current[k] = v
+            self._put(conn, current, key)
+            self._changed(conn, "patch", key, current)
+            return dict(current)
+
+    def re_id(self, old_key, new_key):
+        logger.info("SqliteStore[%s] (re_id) '%s' '%s'", self._name, old_key, new_key)
+        with self._reading(), self._db.transaction() as conn:
+            obj = self.find_by_id(old_key)
+            if obj is None:
+                logger.warning("SqliteStore[%s] (re_id) id='%s' not found for patch", self._name, old_key)
+                raise KeyError("Object not found.")
+            if self._exists(conn, new_key):
+                logger.warning("SqliteStore[%s] (re_id) id='%s' already exists", self._name, new_key)
+                raise ValueError("Already exists.")
+            obj[self._search_key] = new_key
+            self._put(conn, obj, old_key)
+            self._changed(conn, "re_id", old_key, obj)
+            return dict(obj)
+
+
+Store = Union[FileBackedStore, SqliteStore]
+
+def open_store(name: str, file_path: str, search_key: str, records: Optional[NoteRecords] = None, **indexes) -> Store:
+    """Open a store on the backend selected by STORE_BACKEND.
+
+    `records` only applies to JSON stores: SQLite keeps objects on disk already.
+    """
+    if STORE_BACKEND == "sqlite":
+        return SqliteStore(name, SQLITE_PATH, search_key, **indexes)
+    return FileBackedStore(name, file_path, search_key, records=records, **indexes)
+
+
+@contextmanager
+def transaction(*stores: Store):
+    """Batch mutations across several stores.
+
+    SQLite stores sharing a database commit atomically together. JSON stores each
+    persist atomically, one after the other, and all roll back if the block raises.
+    """
+    with ExitStack() as stack:
+        for store in sorted(stores, key=lambda s: s._name):
+            stack.enter_context(store.batch())
+        yield
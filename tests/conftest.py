@@ -0,0 +1,28 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# importing app opens its stores in the working directory: keep them out of the checkout
+_WORKDIR = tempfile.mkdtemp(prefix="journote-tests-")
+os.chdir(_WORKDIR)
+atexit.register(shutil.rmtree, _WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture
+def client():
+    import app
+    return app.app.test_client()
+
+
+@pytest.fixture
+def auth():
+    """Authorization header of a session for user 'tester'."""
+    import app
+    token, _ = app.create_token("tester")
+    return {"Authorization": f"Bearer {token}"}
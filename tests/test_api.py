@@ -0,0 +1,343 @@
+import json
+import uuid
+
+import pytest
+
+import app
+
+
+def unique_tag() -> str:
+    return f"#t{uuid.uuid4().hex[:8]}"
+
+
+def ndjson(*items) -> bytes:
+    return b"".join((item if isinstance(item, bytes) else json.dumps(item).encode("utf-8")) + b"\n" for item in items)
+
+
+# ------------------ Notes ------------------
+
+def test_get_note_after_projected_listing(client, auth):
+    tag = unique_tag()
+    text = f"first line {tag}\nsecond line"
+    note = client.post("/api/notes", json={"text": text}, headers=auth).get_json()["note"]
+
+    listing = client.get(f"/api/notes/Projects/{tag[1:]}?fields=id,date,firstline", headers=auth).get_json()
+    assert listing == [{"id": note["id"], "date": note["date"], "firstline": f"first line {tag}"}]
+
+    response = client.get(f"/api/notes/{listing[0]['id']}", headers=auth)
+    assert response.status_code == 200
+    assert response.get_json() == note
+    assert client.get(f"/api/notes/{note['id']}", headers={**auth, "If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+def test_get_missing_note(client, auth):
+    assert client.get("/api/notes/no-such-note", headers=auth).status_code == 404
+
+
+def add_note(client, auth, text, **fields):
+    return client.post("/api/notes", json={"text": text, **fields}, headers=auth).get_json()["note"]
+
+
+def set_parent(client, auth, tag, parent):
+    body = {"treed": parent is not None, "parent": parent, "content": ""}
+    return client.patch(f"/api/tags/Projects/{tag[1:]}", json=body, headers=auth)
+
+
+def tagged_ids(client, auth, tag):
+    return sorted(note["id"] for note in client.get(f"/api/notes/Projects/{tag[1:]}", headers=auth).get_json())
+
+
+def test_note_writes_keep_tags_in_step(client, auth):
+    kept, dropped, added = unique_tag(), unique_tag(), unique_tag()
+    note = add_note(client, auth, f"note {kept} {dropped}")
+    assert app.STORE_TAGS.find_by_id(dropped) is not None
+
+    response = client.patch(f"/api/notes/{note['id']}", json={"text": f"!!! edited {kept} {added}"}, headers=auth)
+    result = response.get_json()
+    assert response.status_code == 200
+    assert (result["note"]["text"], result["note"]["task"], result["note"]["tags"]) == (f"edited {kept} {added}", "high", [kept, added])
+    assert [tag["name"] for tag in result["new_tags"]] == [added]
+    assert [tag["name"] for tag in result["removed_tags"]] == [dropped]
+    assert app.STORE_TAGS.find_by_id(dropped) is None
+    assert dict(app.STORE_NOTES.find_by_id(note["id"])) == result["note"]
+
+    assert client.delete(f"/api/notes/{note['id']}", headers=auth).get_json()["status"] == "deleted"
+    assert client.get(f"/api/notes/{note['id']}", headers=auth).status_code == 404
+
+
+@pytest.mark.parametrize("body, status", [
+    ({}, 400),
+    ({"text": "x", "date": "2024-02-30"}, 400),
+    ({"text": "bad due date !2024-02-30"}, 400),
+])
+def test_patch_note_rejects_invalid_bodies(client, auth, body, status):
+    note = add_note(client, auth, f"note {unique_tag()}")
+
+    assert client.patch(f"/api/notes/{note['id']}", json=body, headers=auth).status_code == status
+    assert dict(app.STORE_NOTES.find_by_id(note["id"])) == note
+    assert client.patch("/api/notes/no-such-note", json={"text": "x"}, headers=auth).status_code == 404
+
+
+def test_rename_tag_rewrites_notes_and_children(client, auth):
+    tag, child, other, renamed = unique_tag(), unique_tag(), unique_tag(), unique_tag()
+    note = add_note(client, auth, f"note {tag} {other}")
+    add_note(client, auth, f"child note {child}")
+    assert set_parent(client, auth, child, tag).status_code == 200
+
+    body = {"treed": True, "parent": None, "content": "about it", "rename": renamed}
+    response = client.patch(f"/api/tags/Projects/{tag[1:]}", json=body, headers=auth)
+
+    assert response.status_code == 200
+    assert (response.get_json()["name"], response.get_json()["content"]) == (renamed, "about it")
+    assert app.STORE_TAGS.find_by_id(tag) is None
+    assert app.STORE_TAGS.find_by_id(renamed)["content"] == "about it"
+    assert app.STORE_TAGS.find_by_id(child)["parent"] == renamed
+    stored = app.STORE_NOTES.find_by_id(note["id"])
+    assert (stored["text"], stored["tags"]) == (f"note {renamed} {other}", [renamed, other])
+
+
+def test_rename_tag_onto_an_existing_one_changes_nothing(client, auth):
+    tag, existing = unique_tag(), unique_tag()
+    note = add_note(client, auth, f"note {tag} {existing}")
+    before = dict(app.STORE_TAGS.find_by_id(tag))
+
+    body = {"treed": True, "parent": existing, "content": "changed", "rename": existing}
+    response = client.patch(f"/api/tags/Projects/{tag[1:]}", json=body, headers=auth)
+
+    assert response.status_code == 409
+    assert dict(app.STORE_TAGS.find_by_id(tag)) == before
+    assert dict(app.STORE_NOTES.find_by_id(note["id"])) == note
+
+
+@pytest.mark.parametrize("body, status", [
+    ({"treed": True, "parent": None}, 400),
+    ({"treed": True, "parent": None, "content": ""}, 404),
+])
+def test_patch_tag_errors(client, auth, body, status):
+    assert client.patch("/api/tags/Projects/no-such-tag", json=body, headers=auth).status_code == status
+
+
+# ------------------ Notes by tag ------------------
+
+def test_tagged_notes_include_the_tag_subtree(client, auth):
+    root, child, grandchild = unique_tag(), unique_tag(), unique_tag()
+    notes = [add_note(client, auth, f"note {tag}")["id"] for tag in (root, child, grandchild)]
+
+    assert tagged_ids(client, auth, root) == [notes[0]]
+    assert set_parent(client, auth, child, root).status_code == 200
+    assert set_parent(client, auth, grandchild, child).status_code == 200
+    assert tagged_ids(client, auth, root) == sorted(notes)
+    assert tagged_ids(client, auth, child) == sorted(notes[1:])
+
+    set_parent(client, auth, child, None)
+    assert tagged_ids(client, auth, root) == [notes[0]]
+    assert tagged_ids(client, auth, child) == sorted(notes[1:])
+
+
+def test_tagged_notes_with_a_parent_cycle(client, auth):
+    first, second = unique_tag(), unique_tag()
+    notes = [add_note(client, auth, f"note {tag}")["id"] for tag in (first, second)]
+    set_parent(client, auth, first, second)
+    set_parent(client, auth, second, first)
+
+    assert tagged_ids(client, auth, first) == tagged_ids(client, auth, second) == sorted(notes)
+
+
+def test_journal_notes_by_date(client, auth):
+    note = add_note(client, auth, f"dated {unique_tag()}", date="1999-05-04")
+
+    notes = client.get("/api/notes/Journal/1999-05-04", headers=auth).get_json()
+    assert note["id"] in [n["id"] for n in notes]
+    assert client.get("/api/notes/Journal/1999-13-04", headers=auth).status_code == 400
+    assert client.get("/api/notes/Nowhere/x", headers=auth).status_code == 400
+
+
+# ------------------ Counts ------------------
+
+def counts(client, auth, first, last):
+    return client.get(f"/api/notes/counts?from={first}&to={last}", headers=auth).get_json()
+
+
+def test_counts_follow_note_changes(client, auth):
+    before = counts(client, auth, "1998-02-27", "1998-03-01")
+    plain = add_note(client, auth, f"plain {unique_tag()}", date="1998-02-27")
+    task = add_note(client, auth, f"!! task {unique_tag()}", date="1998-02-27")
+
+    after = counts(client, auth, "1998-02-27", "1998-03-01")
+    assert list(after["notes"]) == ["1998-02-27", "1998-02-28", "1998-03-01"]
+    assert after["notes"]["1998-02-27"] == before["notes"]["1998-02-27"] + 2
+    assert after["tasks"]["1998-02-27"] == before["tasks"]["1998-02-27"] + 1
+
+    client.patch(f"/api/notes/{task['id']}", json={"text": "no longer a task", "date": "1998-03-01"}, headers=auth)
+    client.delete(f"/api/notes/{plain['id']}", headers=auth)
+    moved = counts(client, auth, "1998-02-27", "1998-03-01")
+    assert moved["notes"] == {**before["notes"], "1998-03-01": before["notes"]["1998-03-01"] + 1}
+    assert moved["tasks"] == before["tasks"]
+
+    month = client.get("/api/notes/1998/3/count", headers=auth).get_json()
+    assert len(month) == 31 and month["1998-03-01"] == moved["notes"]["1998-03-01"]
+
+
+@pytest.mark.parametrize("path", [
+    "/api/notes/counts",
+    "/api/notes/counts?from=2024-01-01",
+    "/api/notes/counts?from=2024-01-02&to=2024-01-01",
+    "/api/notes/counts?from=2024-02-30&to=2024-03-01",
+    f"/api/notes/counts?from=2000-01-01&to={2000 + app.MAX_COUNT_RANGE_DAYS // 365 + 1}-01-01",
+    "/api/notes/2024/13/count",
+    "/api/notes/10000/1/count",
+    "/api/notes/year/1/count",
+])
+def test_counts_reject_invalid_ranges(client, auth, path):
+    assert client.get(path, headers=auth).status_code == 400
+
+
+# ------------------ Pagination ------------------
+
+def pages(client, auth, path):
+    """Items of every page of `path`, following X-Next-Cursor."""
+    items, cursor = [], None
+    while True:
+        response = client.get(path + (f"&cursor={cursor}" if cursor else ""), headers=auth)
+        assert response.status_code == 200
+        items.extend(response.get_json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return items
+
+
+def test_tag_pages(client, auth):
+    for _ in range(5):
+        add_note(client, auth, f"note {unique_tag()}")
+    everything = client.get("/api/tags", headers=auth).get_json()
+
+    paged = pages(client, auth, "/api/tags?limit=3")
+    assert paged == sorted(everything, key=lambda tag: tag["name"])
+    assert pages(client, auth, "/api/tags?limit=4&fields=name") == [{"name": tag["name"]} for tag in paged]
+
+
+def test_tagged_note_pages(client, auth):
+    tag = unique_tag()
+    notes = [add_note(client, auth, f"note {i} {tag}", date=f"2024-01-0{5 - i % 3}") for i in range(5)]
+
+    paged = pages(client, auth, f"/api/notes/Projects/{tag[1:]}?limit=2&fields=id,date")
+    assert paged == [{"id": n["id"], "date": n["date"]} for n in sorted(notes, key=app.note_order)]
+
+
+@pytest.mark.parametrize("query", ["limit=0", f"limit={app.MAX_PAGE_LIMIT + 1}", "limit=x", "cursor=%%%", "cursor=WzFd"])
+def test_pagination_rejects_invalid_parameters(client, auth, query):
+    assert client.get(f"/api/tags?{query}", headers=auth).status_code == 400
+
+
+# ------------------ ETags ------------------
+
+def test_etag_answers_304_until_the_store_changes(client, auth):
+    first = client.get("/api/tags", headers=auth)
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    assert client.get("/api/tags", headers={**auth, "If-None-Match": etag}).status_code == 304
+    assert client.get("/api/tags", headers=auth).get_data() == first.get_data()
+
+    add_note(client, auth, f"note {unique_tag()}")
+    changed = client.get("/api/tags", headers={**auth, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.get_data() != first.get_data()
+
+
+def test_cached_pages_keep_their_next_cursor(client, auth):
+    add_note(client, auth, f"note {unique_tag()} {unique_tag()}")
+    first = client.get("/api/tags?limit=1", headers=auth)
+    again = client.get("/api/tags?limit=1", headers=auth)
+
+    assert again.get_data() == first.get_data()
+    assert again.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+
+
+def test_responses_past_the_cache_budget_are_served_uncached(client, auth, monkeypatch):
+    monkeypatch.setattr(app, "RESPONSE_CACHE_BYTES", 10)
+    response = client.get("/api/tags?fields=name", headers=auth)
+
+    assert response.status_code == 200
+    assert "/api/tags?fields=name" not in app._RESPONSE_CACHE
+    assert app._response_cache_bytes <= 10
+
+
+def test_errors_carry_no_etag(client, auth):
+    response = client.get("/api/notes/counts", headers=auth)
+
+    assert response.status_code == 400
+    assert "ETag" not in response.headers
+
+
+# ------------------ Import / export ------------------
+
+def test_import_reports_invalid_lines(client, auth):
+    tag, note_id = unique_tag(), uuid.uuid4().hex
+    body = ndjson(
+        {"text": f"first {tag}", "date": "2024-03-01"},
+        b"{not json",
+        ["not", "an", "object"],
+        {"text": "bad date", "date": "2024-02-30"},
+        {"text": "bad due date !2024-02-30"},
+        {"text": "bad fields", "id": "", "task": "urgent", "timestamp": "now"},
+        {"text": f"second {tag}", "id": note_id},
+        {"text": "same id again", "id": note_id},
+    )
+    response = client.post("/api/notes/import", data=body, headers=auth)
+
+    assert response.status_code == 200
+    result = response.get_json()
+    assert (result["imported"], result["rejected"]) == (2, 6)
+    assert [error["line"] for error in result["errors"]] == [2, 3, 4, 5, 6, 8]
+    assert "'id' must be a non-empty string" in result["errors"][4]["error"]
+    assert app.STORE_NOTES.find_by_id(note_id)["text"] == f"second {tag}"
+    assert app.STORE_TAGS.find_by_id(tag) is not None
+
+
+def test_import_skips_existing_notes_and_tags(client, auth):
+    tag = unique_tag()
+    existing = client.post("/api/notes", json={"text": f"existing {tag}"}, headers=auth).get_json()["note"]
+
+    body = ndjson({"text": "again", "id": existing["id"]}, {"text": f"new {tag}"})
+    result = client.post("/api/notes/import", data=body, headers=auth).get_json()
+
+    assert (result["imported"], result["rejected"]) == (1, 1)
+    assert app.STORE_NOTES.find_by_id(existing["id"])["text"] == f"existing {tag}"
+
+
+def test_import_with_tag_created_concurrently(client, auth, monkeypatch):
+    tag = unique_tag()
+    real_transaction = app.transaction
+
+    def transaction_after_other_request(*stores):
+        # another request adds the tag right before the import's transaction starts
+        if app.STORE_TAGS.find_by_id(tag) is None:
+            app.STORE_TAGS.add(app.new_tag(tag))
+        return real_transaction(*stores)
+    monkeypatch.setattr(app, "transaction", transaction_after_other_request)
+
+    response = client.post("/api/notes/import", data=ndjson({"text": f"note {tag}"}), headers=auth)
+
+    assert response.status_code == 200
+    assert response.get_json()["imported"] == 1
+
+
+def test_export_round_trips_through_import(client, auth):
+    tag = unique_tag()
+    note = client.post("/api/notes", json={"text": f"!!2024-05-01 exported {tag}", "date": "2024-04-01"},
+                       headers=auth).get_json()["note"]
+    exported = [json.loads(line) for line in client.get("/api/notes/export", headers=auth).get_data().splitlines()]
+    assert note in exported
+
+    client.delete(f"/api/notes/{note['id']}", headers=auth)
+    result = client.post("/api/notes/import", data=ndjson(note), headers=auth).get_json()
+
+    assert result["imported"] == 1
+    assert dict(app.STORE_NOTES.find_by_id(note["id"])) == note
+
+
+@pytest.mark.parametrize("path", ["/api/notes/import", "/api/notes/export"])
+def test_import_export_need_a_session(client, path):
+    assert client.open(path, method="POST" if path.endswith("import") else "GET").status_code == 401
@@ -0,0 +1,209 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import app
+from app import SessionStore, SharedSessionStore
+from store import FileBackedStore
+
+
+def later(seconds: float) -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=seconds)
+
+
+@pytest.fixture(params=["local", "shared"])
+def sessions(request, tmp_path):
+    if request.param == "local":
+        return SessionStore(max_per_user=3)
+    store = FileBackedStore("sessions", str(tmp_path / "sessions.json"), "token", mode="journal", shared=False,
+                            sync="always", hash_indexes=("username",), sorted_indexes=("exp",))
+    return SharedSessionStore(store, max_per_user=3)
+
+
+# ------------------ Sessions ------------------
+
+def test_sessions_create_get_revoke(sessions):
+    token, exp = sessions.create("alice")
+
+    assert sessions.get(token) == {"username": "alice", "exp": exp}
+    assert sessions.get("unknown") is None
+    assert sessions.revoke(token) is True
+    assert sessions.revoke(token) is False
+    assert sessions.get(token) is None
+
+
+def test_oldest_sessions_evicted_past_max_per_user(sessions):
+    tokens = [sessions.create("alice")[0] for _ in range(5)]
+    other, _ = sessions.create("bob")
+
+    assert [sessions.get(token) is not None for token in tokens] == [False, False, True, True, True]
+    assert sessions.get(other) is not None
+
+
+def test_revoke_user(sessions):
+    tokens = [sessions.create("alice")[0] for _ in range(2)]
+    other, _ = sessions.create("bob")
+
+    assert sessions.revoke_user("alice") == 2
+    assert sessions.revoke_user("alice") == 0
+    assert all(sessions.get(token) is None for token in tokens)
+    assert sessions.get(other) is not None
+
+
+def test_sweep_drops_expired_sessions(sessions):
+    tokens = [sessions.create(f"user{i}")[0] for i in range(3)]
+    sessions.revoke(tokens[0])
+
+    assert sessions.sweep() == 0
+    assert sessions.sweep(later(app.TOKEN_TTL_SECONDS + 1)) == 2
+    assert all(sessions.get(token) is None for token in tokens)
+
+
+def test_sweep_rebuilds_heap_of_revoked_tokens():
+    sessions = SessionStore(max_per_user=1000)
+    kept, _ = sessions.create("alice")
+    for _ in range(100):
+        sessions.revoke(sessions.create("alice")[0])
+
+    assert sessions.sweep() == 0
+    assert sessions._expiry == [(sessions.get(kept)["exp"].timestamp(), kept)]
+
+
+# ------------------ Signout ------------------
+
+def test_signout_revokes_only_the_current_token(client):
+    username = f"user-{uuid.uuid4().hex[:8]}"
+    first, _ = app.create_token(username)
+    second, _ = app.create_token(username)
+
+    response = client.post("/api/auth/signout", headers={"Authorization": f"Bearer {first}"})
+    assert response.status_code == 200
+    assert client.get("/api/tags", headers={"Authorization": f"Bearer {first}"}).status_code == 401
+    assert client.get("/api/tags", headers={"Authorization": f"Bearer {second}"}).status_code == 200
+
+
+def test_signout_all_revokes_every_token_of_the_user(client, auth):
+    username = f"user-{uuid.uuid4().hex[:8]}"
+    tokens = [app.create_token(username)[0] for _ in range(3)]
+
+    response = client.post("/api/auth/signout-all", headers={"Authorization": f"Bearer {tokens[0]}"})
+    assert response.get_json() == {"status": "signed_out", "revoked": 3}
+    assert all(client.get("/api/tags", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+               for token in tokens)
+    assert client.get("/api/tags", headers=auth).status_code == 200
+
+
+def test_expired_token_is_rejected(client, monkeypatch):
+    token, _ = app.create_token(f"user-{uuid.uuid4().hex[:8]}")
+    monkeypatch.setattr(app, "TOKEN_TTL_SECONDS", -1)
+    expired, _ = app.create_token(f"user-{uuid.uuid4().hex[:8]}")
+
+    response = client.get("/api/tags", headers={"Authorization": f"Bearer {expired}"})
+    assert response.get_json()["error"]["message"] == "Token expired."
+    assert app.get_session(expired) is None
+    assert client.get("/api/tags", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+
+
+# ------------------ Signin ------------------
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_limiter(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(app.time, "monotonic", clock)
+    limiter = app.TokenBucketLimiter(rate_per_minute=6, burst=2, max_keys=2)
+
+    assert [limiter.acquire("a") for _ in range(2)] == [0, 0]
+    assert limiter.acquire("a") == pytest.approx(10)
+    clock.now += 5
+    assert limiter.acquire("a") == pytest.approx(5)
+    clock.now += 10
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("b") == 0
+
+    limiter.acquire("c")  # past max_keys: "a", the least recently used, is forgotten
+    assert [limiter.acquire("a") for _ in range(2)] == [0, 0]
+
+
+@pytest.fixture
+def user():
+    username = f"user-{uuid.uuid4().hex[:8]}"
+    app.STORE_USERS.add({"username": username, "password_hash": app.PASSWORD_VERIFIER.hash("secret")})
+    return username
+
+
+@pytest.fixture
+def limiters(monkeypatch):
+    monkeypatch.setattr(app, "SIGNIN_USER_LIMITER", app.TokenBucketLimiter(6, 2))
+    monkeypatch.setattr(app, "SIGNIN_IP_LIMITER", app.TokenBucketLimiter(60, 100))
+
+
+def test_signin(client, user, limiters):
+    response = client.post("/api/auth/signin", json={"username": user, "password": "secret"})
+    assert response.status_code == 201
+    token = response.get_json()["token"]
+    assert client.get("/api/tags", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+
+    assert client.post("/api/auth/signin", json={"username": user, "password": "wrong"}).status_code == 401
+    assert client.post("/api/auth/signin", json={"username": "nobody", "password": "x"}).status_code == 401
+
+
+@pytest.mark.parametrize("body", [
+    {"username": "tester"},
+    {"username": "", "password": "x"},
+    {"username": ["tester"], "password": "x"},
+    {"username": {"name": "tester"}, "password": "x"},
+    {"username": "tester", "password": ["x"]},
+    {"username": 42, "password": "x"},
+])
+def test_signin_rejects_missing_or_non_string_credentials(client, body, limiters):
+    assert client.post("/api/auth/signin", json=body).status_code == 400
+    # not counted against the user's attempts
+    assert app.SIGNIN_USER_LIMITER.acquire("tester") == 0
+
+
+def test_signin_rate_limited_per_user(client, user, limiters):
+    for _ in range(2):
+        assert client.post("/api/auth/signin", json={"username": user, "password": "wrong"}).status_code == 401
+
+    response = client.post("/api/auth/signin", json={"username": user, "password": "secret"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "10"
+
+
+def test_signin_busy_when_verifier_is_full(client, user, limiters, monkeypatch):
+    monkeypatch.setattr(app.PASSWORD_VERIFIER, "verify", lambda *args: None)
+
+    response = client.post("/api/auth/signin", json={"username": user, "password": "secret"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_signin_upgrades_outdated_password_hashes(client, limiters):
+    username = f"user-{uuid.uuid4().hex[:8]}"
+    app.STORE_USERS.add({"username": username,
+                         "password_hash": app.generate_password_hash("secret", "pbkdf2:sha256:1000")})
+
+    assert client.post("/api/auth/signin", json={"username": username, "password": "secret"}).status_code == 201
+    stored = app.STORE_USERS.find_by_id(username)["password_hash"]
+    assert not app.PASSWORD_VERIFIER.needs_rehash(stored)
+    assert app.check_password_hash(stored, "secret")
+
+
+def test_password_verifier_caches_successes():
+    verifier = app.PasswordVerifier(workers=1, queue=0)
+    password_hash = verifier.hash("secret")
+
+    assert verifier.verify("alice", "secret", password_hash) is True
+    assert verifier.verify("alice", "wrong", password_hash) is False
+    verifier._slots.acquire()  # every slot taken: only cached successes get through
+    assert verifier.verify("alice", "secret", password_hash) is True
+    assert verifier.verify("alice", "other", password_hash) is None
+    assert verifier.verify("alice", "secret", verifier.hash("secret")) is None
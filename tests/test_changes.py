@@ -0,0 +1,111 @@
+import uuid
+
+import pytest
+
+import app
+import store as store_module
+from app import ChangeLog
+
+from test_store import open_backend, reopen_backend
+
+
+def unique_tag() -> str:
+    return f"#t{uuid.uuid4().hex[:8]}"
+
+
+@pytest.fixture(params=["journal", "sqlite"])
+def stores(request, tmp_path):
+    return open_backend(request.param, tmp_path, "notes"), open_backend(request.param, tmp_path, "tags")
+
+
+def ids(objs):
+    return sorted(obj["id"] for obj in objs)
+
+
+# ------------------ ChangeLog ------------------
+
+def test_since_reports_the_last_state_of_each_key(stores):
+    notes, tags = stores
+    notes.add({"id": "a"})
+    notes.add({"id": "c"})
+    log = ChangeLog({"notes": notes, "tags": tags})
+    revision = log.revision()
+
+    notes.add({"id": "b"})
+    notes.patch("a", {"text": "edited"})
+    notes.delete("b")
+    notes.re_id("c", "cc")
+    tags.add({"id": "#x"})
+
+    current, changes = log.since(revision)
+    assert current == log.revision() != revision
+    assert changes["notes"] == {
+        "upserted": [{"id": "a", "text": "edited"}, {"id": "cc"}],
+        "deleted": ["b", "c"],
+        "renamed": [{"from": "c", "to": "cc"}],
+    }
+    assert changes["tags"] == {"upserted": [{"id": "#x"}], "deleted": [], "renamed": []}
+    assert log.since(current) == (current, {name: {"upserted": [], "deleted": [], "renamed": []}
+                                            for name in ("notes", "tags")})
+
+
+def test_since_needs_a_resync_for_unknown_revisions(stores):
+    notes, tags = stores
+    log = ChangeLog({"notes": notes, "tags": tags})
+    revision = log.revision()
+
+    assert log.since(revision.split("-")[0]) is None
+    assert log.since(f"{revision}-extra") is None
+    assert log.since("unknown.1-unknown.2") is None
+
+
+def test_since_needs_a_resync_past_the_retained_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(store_module, "CHANGELOG_SIZE", 3)
+    notes, tags = open_backend("journal", tmp_path, "notes"), open_backend("journal", tmp_path, "tags")
+    log = ChangeLog({"notes": notes, "tags": tags})
+    revision = log.revision()
+    for i in range(3):
+        notes.add({"id": str(i)})
+    assert log.since(revision) is not None
+
+    notes.add({"id": "3"})
+    assert log.since(revision) is None
+
+
+def test_revision_answered_by_another_connection(tmp_path):
+    notes, tags = open_backend("sqlite", tmp_path, "notes"), open_backend("sqlite", tmp_path, "tags")
+    other = ChangeLog({"notes": reopen_backend("sqlite", tmp_path, "notes"),
+                       "tags": reopen_backend("sqlite", tmp_path, "tags")})
+    revision = ChangeLog({"notes": notes, "tags": tags}).revision()
+
+    notes.add({"id": "a"})
+    tags.add({"id": "#x"})
+
+    current, changes = other.since(revision)
+    assert current == ChangeLog({"notes": notes, "tags": tags}).revision()
+    assert ids(changes["notes"]["upserted"]) == ["a"]
+    assert ids(changes["tags"]["upserted"]) == ["#x"]
+
+
+# ------------------ /api/changes ------------------
+
+def test_changes_route(client, auth):
+    first = client.get("/api/changes", headers=auth).get_json()
+    assert first["resync"] is True
+    assert client.get("/api/changes?since=bogus", headers=auth).get_json()["resync"] is True
+
+    tag = unique_tag()
+    note = client.post("/api/notes", json={"text": f"note {tag}"}, headers=auth).get_json()["note"]
+    changes = client.get(f"/api/changes?since={first['rev']}", headers=auth).get_json()
+    assert changes["resync"] is False
+    assert note["id"] in [obj["id"] for obj in changes["notes"]["upserted"]]
+    assert tag in [obj["name"] for obj in changes["tags"]["upserted"]]
+
+    client.delete(f"/api/notes/{note['id']}", headers=auth)
+    later = client.get(f"/api/changes?since={changes['rev']}", headers=auth).get_json()
+    assert note["id"] in later["notes"]["deleted"]
+    assert app.CHANGE_LOG.since(later["rev"])[1]["notes"]["upserted"] == []
+
+
+def test_changes_route_needs_a_session(client):
+    assert client.get("/api/changes").status_code == 401
@@ -0,0 +1,67 @@
+import uuid
+
+import app
+from metrics import METRICS, Metrics
+from store import FileBackedStore
+
+
+def test_render_counters_and_histograms():
+    metrics = Metrics()
+    metrics.counter("ops_total", "Operations.", ("op",))
+    metrics.histogram("size", "Sizes.", ("store",), (10, 100))
+    metrics.inc("ops_total", ("add",))
+    metrics.inc("ops_total", ("add",), 2)
+    metrics.inc("ops_total", ('say "hi"\n',))
+    for value in (5, 10, 50, 500):
+        metrics.observe("size", ("notes",), value)
+
+    assert metrics.render().splitlines() == [
+        "# HELP ops_total Operations.",
+        "# TYPE ops_total counter",
+        'ops_total{op="add"} 3',
+        'ops_total{op="say \\"hi\\"\\n"} 1',
+        "# HELP size Sizes.",
+        "# TYPE size histogram",
+        'size_bucket{store="notes",le="10"} 2',
+        'size_bucket{store="notes",le="100"} 3',
+        'size_bucket{store="notes",le="+Inf"} 4',
+        'size_sum{store="notes"} 565.0',
+        'size_count{store="notes"} 4',
+    ]
+
+
+def test_store_writes_and_scans_are_recorded(tmp_path):
+    name = f"objs{uuid.uuid4().hex[:8]}"
+    store = FileBackedStore(name, str(tmp_path / "objs.json"), "id", mode="journal", shared=False, sync="always",
+                            hash_indexes=("parent",))
+    store.add({"id": "a", "parent": "p", "kind": "x"})
+    store.find_eq("parent", "p")
+    store.find_eq("kind", "x")
+
+    rendered = METRICS.render()
+    assert f'journote_store_write_bytes_total{{store="{name}",kind="journal"}}' in rendered
+    assert f'journote_store_write_seconds_count{{store="{name}",kind="journal"}} 1' in rendered
+    assert f'journote_store_scan_objects_count{{store="{name}",op="find_eq"}} 1' in rendered
+
+
+def test_metrics_route_needs_a_token(client, auth, monkeypatch):
+    assert client.get("/api/metrics").status_code == 401
+    assert client.get("/api/metrics", headers={"Authorization": "Bearer scraper"}).status_code == 401
+
+    monkeypatch.setattr(app, "METRICS_TOKEN", "scraper")
+    assert client.get("/api/metrics", headers={"Authorization": "Bearer scraper"}).status_code == 200
+    assert client.get("/api/metrics", headers=auth).status_code == 200
+
+
+def test_metrics_route_reports_request_latencies(client, auth):
+    client.get("/api/health", headers=auth)
+    response = client.get("/api/metrics", headers=auth)
+
+    assert response.mimetype == "text/plain"
+    assert 'journote_http_request_duration_seconds_count{method="GET",route="/api/health",status="200"}' \
+        in response.get_data(as_text=True)
+
+
+def test_health_needs_a_session(client, auth):
+    assert client.get("/api/health").status_code == 401
+    assert client.get("/api/health", headers=auth).get_json()["status"] == "ok"
@@ -0,0 +1,71 @@
+import uuid
+
+import pytest
+
+from app import SearchIndex
+from store import FileBackedStore
+
+
+@pytest.fixture
+def notes(tmp_path):
+    store = FileBackedStore("notes", str(tmp_path / "notes.json"), "id", mode="snapshot", shared=False)
+    store.add({"id": "a", "text": "Budget review with the design team"})
+    store.add({"id": "b", "text": "budget budget budget, again the budget"})
+    store.add({"id": "c", "text": "Design draft for the release"})
+    return store
+
+
+def test_search_matches_every_term(notes):
+    index = SearchIndex(notes)
+
+    assert sorted(index.search("design", 10)) == ["a", "c"]
+    assert index.search("BUDGET design", 10) == ["a"]
+    assert index.search("budget release", 10) == []
+    assert index.search("...", 10) == []
+
+
+def test_search_ranks_by_term_frequency(notes):
+    index = SearchIndex(notes)
+
+    assert index.search("budget", 10) == ["b", "a"]
+    assert index.search("budget", 1) == ["b"]
+
+
+def test_search_expands_prefixes_below_exact_matches(notes):
+    notes.add({"id": "d", "text": "rev"})
+    index = SearchIndex(notes)
+
+    assert sorted(index.search("des", 10)) == ["a", "c"]
+    assert index.search("rev", 10) == ["d", "a"]
+
+
+def test_search_follows_store_changes(notes):
+    index = SearchIndex(notes)
+
+    notes.patch("b", {"text": "nothing left"})
+    notes.re_id("c", "cc")
+    notes.delete("a")
+    notes.add({"id": "e", "text": "budget"})
+
+    assert index.search("budget", 10) == ["e"]
+    assert index.search("release", 10) == ["cc"]
+    assert index.search("left", 10) == ["b"]
+    assert index.search("team", 10) == []
+
+
+# ------------------ /api/search ------------------
+
+def test_search_route(client, auth):
+    word = f"w{uuid.uuid4().hex[:10]}"
+    notes = [client.post("/api/notes", json={"text": text}, headers=auth).get_json()["note"]
+             for text in (f"{word} once", f"{word} {word} twice", "unrelated")]
+
+    found = client.get(f"/api/search?q={word}", headers=auth).get_json()
+    assert [n["id"] for n in found] == [notes[1]["id"], notes[0]["id"]]
+    assert client.get(f"/api/search?q={word[:-2]}&limit=1&fields=id", headers=auth).get_json() == [{"id": notes[1]["id"]}]
+    assert client.get(f"/api/search?q={word}+unrelated", headers=auth).get_json() == []
+
+
+@pytest.mark.parametrize("query", ["", "?q=", "?q=%20", "?q=x&limit=0"])
+def test_search_route_rejects_invalid_queries(client, auth, query):
+    assert client.get(f"/api/search{query}", headers=auth).status_code == 400
@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import store as store_module
+from store import FileBackedStore, SqliteStore
+
+from test_store import INDEXES, Mirror, by_id
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def open_pair(tmp_path):
+    """Two stores on one database through distinct connections, as two processes would have."""
+    first = SqliteStore("objs", str(tmp_path / "store.db"), "id", **INDEXES)
+    second = SqliteStore("objs", f"{tmp_path}/./store.db", "id", **INDEXES)
+    return first, second
+
+
+# ------------------ Polling the change feed ------------------
+
+def test_poll_passes_other_connections_commits_to_listeners(tmp_path):
+    first, second = open_pair(tmp_path)
+    first.add({"id": "a", "parent": "p1", "tags": ["#x"], "date": "2024-01-01"})
+    first.add({"id": "b", "parent": "p1", "tags": [], "date": None})
+    mirror = Mirror(first)
+
+    second.add({"id": "c", "parent": "p2", "tags": ["#x"], "date": "2024-01-02"})
+    with second.batch():
+        second.patch("a", {"parent": "p2"})
+        second.re_id("b", "bb")
+    second.delete("c")
+
+    assert by_id(first.find_all()) == by_id(second.find_all())
+    assert mirror.objs == by_id(first.find_all())
+    assert ("reload", None) not in mirror.events[1:]
+    assert first.version == second.version
+
+
+def test_changes_since_follows_other_connections(tmp_path):
+    first, second = open_pair(tmp_path)
+    first.add({"id": "a", "parent": "p1", "tags": [], "date": None})
+    version = first.version
+
+    second.patch("a", {"parent": "p2"})
+    second.re_id("a", "aa")
+
+    first.find_all()
+    assert first.changes_since(version) == [("patch", "a", None), ("re_id", "a", "aa")]
+    assert second.changes_since(version) == first.changes_since(version)
+
+
+def test_poll_reloads_after_missing_pruned_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(store_module, "CHANGELOG_SIZE", 2)
+    monkeypatch.setattr(store_module, "CHANGES_PRUNE_EVERY", 2)
+    first, second = open_pair(tmp_path)
+    first.add({"id": "a", "parent": "p1", "tags": [], "date": None})
+    mirror = Mirror(first)
+    version = first.version
+
+    for i in range(6):
+        second.add({"id": str(i), "parent": "p2", "tags": [], "date": None})
+    second.delete("a")
+
+    assert by_id(first.find_all()) == by_id(second.find_all())
+    assert mirror.events[-1] == ("reload", None)
+    assert mirror.objs == by_id(first.find_all())
+    assert first.changes_since(version) is None
+
+
+def test_rollback_refreshes_listeners_of_every_store_in_the_transaction(tmp_path):
+    db_path = str(tmp_path / "store.db")
+    tags = SqliteStore("tags", db_path, "name", hash_indexes=("parent",))
+    notes = SqliteStore("notes", db_path, "id", **INDEXES)
+    tags.add({"name": "#x", "parent": None})
+    notes.add({"id": "a", "parent": "p1", "tags": ["#x"], "date": None})
+    tag_mirror, note_mirror = Mirror(tags, "name"), Mirror(notes)
+
+    with pytest.raises(RuntimeError):
+        with store_module.transaction(tags, notes):
+            tags.add({"name": "#y", "parent": "#x"})
+            notes.patch("a", {"tags": ["#x", "#y"]})
+            notes.add({"id": "b", "parent": "p1", "tags": ["#y"], "date": None})
+            raise RuntimeError("abort")
+
+    assert tag_mirror.objs == {"#x": {"name": "#x", "parent": None}}
+    assert note_mirror.objs == {"a": {"id": "a", "parent": "p1", "tags": ["#x"], "date": None}}
+
+
+def test_iter_all_in_chunks(tmp_path):
+    first, second = open_pair(tmp_path)
+    for i in range(7):
+        first.add({"id": str(i), "parent": None, "tags": [], "date": None})
+
+    objs = first.iter_all(chunk_size=3)
+    seen = [next(objs)["id"] for _ in range(3)]
+    second.delete("5")  # committed between two chunks
+    seen += [obj["id"] for obj in objs]
+
+    assert seen == ["0", "1", "2", "3", "4", "6"]
+
+
+# ------------------ migrate-sqlite ------------------
+
+def test_migrate_sqlite_copies_json_files_without_rewriting_them(tmp_path):
+    def open_json(name, search_key):
+        return FileBackedStore(name, str(tmp_path / f"{name}.json"), search_key, mode="journal", shared=False,
+                               sync="always")
+    users, tags, notes = open_json("users", "username"), open_json("tags", "name"), open_json("notes", "id")
+    users.add({"username": "alice", "password_hash": "x"})
+    tags.add({"name": "#x", "parent": None})
+    for i in range(3):
+        notes.add({"id": str(i), "text": f"note {i} #x", "date": "2024-01-01", "tags": ["#x"]})
+    notes.delete("1")
+    with open(tmp_path / "notes.json.journal", "ab") as f:
+        f.write(b'{"op": "add", "key": "torn')  # torn tail of a crashed writer
+    before = {name: (tmp_path / name).read_bytes() for name in sorted(os.listdir(tmp_path))}
+
+    env = {**os.environ, "STORE_BACKEND": "sqlite", "SQLITE_PATH": str(tmp_path / "journote.db"),
+           "PYTHONPATH": REPO}
+    result = subprocess.run([sys.executable, "-m", "flask", "--app", "app", "migrate-sqlite"],
+                            cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+
+    assert {name: (tmp_path / name).read_bytes() for name in before} == before
+    with sqlite3.connect(tmp_path / "journote.db") as conn:
+        assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM tags").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0] == 2
+    migrated = SqliteStore("notes", str(tmp_path / "journote.db"), "id")
+    assert sorted(obj["id"] for obj in migrated.find_all()) == ["0", "2"]
@@ -0,0 +1,417 @@
+import pytest
+
+import store as store_module
+from store import FileBackedStore, NoteRecord, NoteRecords, SqliteStore
+
+INDEXES = {"hash_indexes": ("parent",), "list_indexes": ("tags",), "sorted_indexes": ("date",)}
+
+
+def open_at(path, mode="journal", **indexes) -> FileBackedStore:
+    return FileBackedStore("test", str(path / "objs.json"), "id", mode=mode, shared=False, sync="always", **indexes)
+
+
+def reopen(store: FileBackedStore) -> FileBackedStore:
+    """A second instance on the same files, loading what the first one persisted."""
+    return FileBackedStore("test", store.file_path, "id", mode=store._mode, shared=False, sync="always",
+                           **INDEXES)
+
+
+def contents(store: FileBackedStore):
+    return {key: dict(obj) for key, obj in store._data.items()}
+
+
+def index_state(store: FileBackedStore):
+    buckets = {kind_field: {value: set(keys) for value, keys in values.items()}
+               for kind_field, values in store._buckets.items()}
+    return buckets, {field: list(entries) for field, entries in store._sorted.items()}, dict(store._indexed)
+
+
+# ------------------ Store contract, on every backend ------------------
+
+def open_backend(backend: str, path, name: str = "objs"):
+    """A store of `backend`: FileBackedStore in "snapshot"/"journal" mode, or SqliteStore."""
+    if backend == "sqlite":
+        return SqliteStore(name, str(path / "store.db"), "id", **INDEXES)
+    return FileBackedStore(name, str(path / f"{name}.json"), "id", mode=backend, shared=False, sync="always", **INDEXES)
+
+
+def reopen_backend(backend: str, path, name: str = "objs"):
+    """Another instance on the same files or database, as another process would open it."""
+    if backend == "sqlite":
+        # a distinct path string gets its own connection
+        return SqliteStore(name, f"{path}/./store.db", "id", **INDEXES)
+    return open_backend(backend, path, name)
+
+
+class Mirror:
+    """Listener keeping a copy of the store's objects from the events it receives."""
+    def __init__(self, store, search_key: str = "id"):
+        self.store = store
+        self.search_key = search_key
+        self.objs = {}
+        self.events = []
+        store.add_listener(self)
+
+    def __call__(self, op, key, obj):
+        self.events.append((op, key))
+        if op == "reload":
+            self.objs = {o[self.search_key]: dict(o) for o in self.store.find_all()}
+            return
+        if key is not None:
+            self.objs.pop(key, None)
+        if op != "delete":
+            self.objs[obj[self.search_key]] = dict(obj)
+
+
+def by_id(objs):
+    return {obj["id"]: dict(obj) for obj in objs}
+
+
+def ids(objs):
+    return [obj["id"] for obj in objs]
+
+
+BACKENDS = ["snapshot", "journal", "sqlite"]
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    return request.param
+
+
+def fill(store):
+    store.add({"id": "a", "parent": "p1", "tags": ["#x", "#y"], "date": "2024-01-02"})
+    store.add({"id": "b", "parent": "p1", "tags": ["#y"], "date": "2024-01-01"})
+    store.add({"id": "c", "parent": "p2", "tags": [], "date": "2024-01-03"})
+    store.add({"id": "d", "parent": None, "tags": ["#x"], "date": None})
+
+
+def test_lookups(backend, tmp_path):
+    store = open_backend(backend, tmp_path)
+    fill(store)
+
+    assert store.find_by_id("a")["tags"] == ["#x", "#y"]
+    assert store.find_by_id("z") is None
+    assert sorted(ids(store.find_eq("parent", "p1"))) == ["a", "b"]
+    assert sorted(ids(store.find_any("parent", ["p2", None]))) == ["c", "d"]
+    assert sorted(ids(store.find_in_list("tags", "#x"))) == ["a", "d"]
+    assert sorted(ids(store.find_in_list_any("tags", ["#x", "#y"]))) == ["a", "b", "d"]
+    assert ids(store.find_range("date", "2024-01-01", "2024-01-02")) == ["b", "a"]
+    assert sorted(ids(store.find_all())) == ["a", "b", "c", "d"]
+    assert by_id(store.iter_all()) == by_id(store.find_all())
+
+
+def test_mutations(backend, tmp_path):
+    store = open_backend(backend, tmp_path)
+    fill(store)
+
+    assert store.patch("a", {"id": "ignored", "parent": "p2", "tags": ["#z"]})["parent"] == "p2"
+    assert store.re_id("b", "bb")["id"] == "bb"
+    store.delete("c")
+
+    assert by_id(store.find_all()) == {
+        "a": {"id": "a", "parent": "p2", "tags": ["#z"], "date": "2024-01-02"},
+        "bb": {"id": "bb", "parent": "p1", "tags": ["#y"], "date": "2024-01-01"},
+        "d": {"id": "d", "parent": None, "tags": ["#x"], "date": None},
+    }
+    assert sorted(ids(store.find_eq("parent", "p2"))) == ["a"]
+    assert ids(store.find_in_list("tags", "#y")) == ["bb"]
+    assert ids(store.find_range("date", "", "9999")) == ["bb", "a"]
+    assert by_id(reopen_backend(backend, tmp_path).find_all()) == by_id(store.find_all())
+
+
+def test_mutation_errors(backend, tmp_path):
+    store = open_backend(backend, tmp_path)
+    fill(store)
+    before = by_id(store.find_all())
+
+    with pytest.raises(ValueError):
+        store.add({"id": "a"})
+    with pytest.raises(ValueError):
+        store.re_id("a", "b")
+    for mutation in (lambda: store.patch("z", {}), lambda: store.delete("z"), lambda: store.re_id("z", "y")):
+        with pytest.raises(KeyError):
+            mutation()
+
+    assert by_id(store.find_all()) == before
+
+
+def test_listeners_follow_mutations(backend, tmp_path):
+    store = open_backend(backend, tmp_path)
+    fill(store)
+    mirror = Mirror(store)
+
+    store.add({"id": "e", "parent": "p3", "tags": [], "date": None})
+    store.patch("a", {"parent": "p3"})
+    store.re_id("b", "bb")
+    store.delete("c")
+
+    assert mirror.events == [("reload", None), ("add", "e"), ("patch", "a"), ("re_id", "b"), ("delete", "c")]
+    assert mirror.objs == by_id(store.find_all())
+
+
+def test_batch_rolls_back(backend, tmp_path):
+    store = open_backend(backend, tmp_path)
+    fill(store)
+    mirror = Mirror(store)
+    before, version = by_id(store.find_all()), store.version
+
+    with pytest.raises(RuntimeError):
+        with store.batch():
+            store.add({"id": "e", "parent": "p3", "tags": ["#x"], "date": "2024-02-01"})
+            store.patch("a", {"parent": "p3"})
+            store.re_id("b", "bb")
+            store.delete("c")
+            raise RuntimeError("abort")
+
+    assert by_id(store.find_all()) == before
+    assert mirror.objs == before
+    assert sorted(ids(store.find_eq("parent", "p1"))) == ["a", "b"]
+    assert sorted(ids(store.find_in_list("tags", "#x"))) == ["a", "d"]
+    assert store.version == version
+    assert by_id(reopen_backend(backend, tmp_path).find_all()) == before
+
+
+def test_versions_and_changes(backend, tmp_path):
+    store = open_backend(backend, tmp_path)
+    fill(store)
+    version = store.version
+    store.find_all()
+    assert store.version == version
+    assert store.changes_since(version) == []
+
+    store.patch("a", {"parent": "p3"})
+    with store.batch():
+        store.re_id("b", "bb")
+        store.delete("c")
+
+    assert store.version != version
+    assert store.changes_since(version) == [("patch", "a", None), ("re_id", "b", "bb"), ("delete", "c", None)]
+    assert store.changes_since("unknown.1") is None
+
+
+# ------------------ Shared stores ------------------
+
+@pytest.mark.parametrize("mode", ["snapshot", "journal"])
+def test_shared_stores_see_each_others_writes(mode, tmp_path):
+    def open_shared():
+        return FileBackedStore("objs", str(tmp_path / "objs.json"), "id", mode=mode, shared=True, **INDEXES)
+    first, second = open_shared(), open_shared()
+    mirror = Mirror(first)
+
+    first.add({"id": "a", "parent": "p1", "tags": ["#x"], "date": "2024-01-01"})
+    second.patch("a", {"parent": "p2"})
+    second.add({"id": "b", "parent": "p2", "tags": [], "date": None})
+    with second.batch():
+        second.re_id("b", "bb")
+        second.add({"id": "c", "parent": "p1", "tags": ["#x"], "date": "2024-01-02"})
+
+    assert sorted(ids(first.find_eq("parent", "p2"))) == ["a", "bb"]
+    assert by_id(first.find_all()) == by_id(second.find_all())
+    assert mirror.objs == by_id(first.find_all())
+    assert first.version == second.version
+    with pytest.raises(ValueError):
+        first.add({"id": "c"})
+
+
+# ------------------ Batch rollback ------------------
+
+@pytest.fixture(params=["snapshot", "journal"])
+def indexed_store(request, tmp_path):
+    store = open_at(tmp_path, mode=request.param, **INDEXES)
+    for i in range(4):
+        store.add({"id": str(i), "parent": f"p{i % 2}", "tags": [f"#t{i}", "#all"], "date": f"2024-01-0{i + 1}"})
+    return store
+
+
+def mutate(store: FileBackedStore):
+    store.patch("0", {"parent": "p9", "tags": ["#new"], "date": "2024-02-01"})
+    store.delete("1")
+    store.re_id("2", "22")
+    store.add({"id": "4", "parent": "p0", "tags": ["#all"], "date": "2023-12-31"})
+
+
+def test_rollback_when_block_raises(indexed_store):
+    store = indexed_store
+    before, indexes, version = contents(store), index_state(store), store.version
+
+    with pytest.raises(RuntimeError):
+        with store.batch():
+            mutate(store)
+            raise RuntimeError("abort")
+
+    assert contents(store) == before
+    assert index_state(store) == indexes
+    assert store.version == version
+    assert contents(reopen(store)) == before
+
+
+def test_rollback_when_listener_raises(indexed_store):
+    store = indexed_store
+    before, indexes = contents(store), index_state(store)
+
+    def listener(op, key, obj):
+        if obj is not None and obj["id"] == "4":
+            raise RuntimeError("listener failed")
+    store.add_listener(listener)
+
+    with pytest.raises(RuntimeError):
+        with store.batch():
+            mutate(store)
+
+    assert contents(store) == before
+    assert index_state(store) == indexes
+
+
+def test_rollback_continues_when_listener_raises_while_undoing(indexed_store):
+    store = indexed_store
+    before, indexes = contents(store), index_state(store)
+    failing = []
+
+    def listener(op, key, obj):
+        if failing:
+            raise RuntimeError("listener failed")
+    store.add_listener(listener)
+
+    with pytest.raises(ValueError):
+        with store.batch():
+            mutate(store)
+            failing.append(True)
+            raise ValueError("abort")
+
+    assert contents(store) == before
+    assert index_state(store) == indexes
+
+
+@pytest.mark.parametrize("bad", [
+    {"id": "4", "parent": ["unhashable"]},
+    {"id": "4", "tags": [["unhashable"]]},
+    {"id": "4", "date": 20240101},  # not comparable with the other dates
+])
+def test_rollback_when_index_insert_raises(indexed_store, bad):
+    store = indexed_store
+    before, indexes = contents(store), index_state(store)
+
+    with pytest.raises(TypeError):
+        with store.batch():
+            store.patch("0", {"parent": "p9", "date": "2024-02-01"})
+            store.delete("1")
+            store.add(bad)
+
+    assert contents(store) == before
+    assert index_state(store) == indexes
+
+
+def test_single_mutation_rolls_back_when_index_insert_raises(indexed_store):
+    store = indexed_store
+    before, indexes = contents(store), index_state(store)
+
+    with pytest.raises(TypeError):
+        store.patch("0", {"parent": {"un": "hashable"}})
+
+    assert contents(store) == before
+    assert index_state(store) == indexes
+
+
+def test_mutations_return_copies(indexed_store):
+    store = indexed_store
+    before = contents(store)
+    added = {"id": "4", "parent": "p0"}
+    with pytest.raises(RuntimeError):
+        with store.batch():
+            store.add(added)
+            added["parent"] = "changed"
+            patched = store.patch("0", {"parent": "p9"})
+            patched["parent"] = "changed"
+            renamed = store.re_id("1", "11")
+            renamed["id"] = "changed"
+            assert store.find_by_id("4")["parent"] == "p0"
+            assert store.find_by_id("0")["parent"] == "p9"
+            assert store.find_by_id("11")["id"] == "11"
+            raise RuntimeError("abort")
+
+    assert contents(store) == before
+
+    store.patch("0", {"parent": "p9"})["parent"] = "changed"
+    store.re_id("1", "11")["id"] = "changed"
+    assert contents(reopen(store)) == contents(store)
+    assert store.find_by_id("0")["parent"] == "p9"
+
+
+# ------------------ NoteRecords ------------------
+
+NOTE = {"id": "n1", "timestamp": "2024-01-01T10:00:00", "date": "2024-01-01", "text": "héllo #x\nbody",
+        "task": "todo", "tags": ["#x"], "duedate": "2024-02-01"}
+
+
+@pytest.mark.parametrize("note", [
+    NOTE,
+    {"id": "n2", "text": "no date"},
+    {"id": "n3", "date": None, "task": None, "duedate": None, "tags": []},
+    # unexpected types and fields are kept as they are
+    {"id": "n4", "date": "2024-1-1", "task": 3, "tags": "#x", "text": ["a"], "extra": {"k": 1}},
+    {"id": "n5", "date": 20240101, "duedate": ["2024-01-01"], "tags": [1, 2]},
+])
+@pytest.mark.parametrize("on_disk", [False, True])
+def test_note_record_reads_like_the_dict(note, on_disk, tmp_path):
+    record = NoteRecords(str(tmp_path) if on_disk else None).pack(note)
+
+    assert dict(record) == note
+    assert len(record) == len(note)
+    assert all(field in record and record[field] == value for field, value in note.items())
+    assert "missing" not in record
+    with pytest.raises(KeyError):
+        record["missing"]
+
+
+def test_note_texts_on_disk(tmp_path):
+    records = NoteRecords(str(tmp_path))
+    store = FileBackedStore("notes", str(tmp_path / "notes.json"), "id", mode="journal", shared=False,
+                            sync="always", records=records, list_indexes=("tags",), sorted_indexes=("date",))
+    store.add(NOTE)
+    record = store._data["n1"]
+
+    assert isinstance(record, NoteRecord) and isinstance(record._text, int)
+    assert store.find_by_id("n1")["text"] == NOTE["text"]
+    assert store.patch("n1", {"text": "edited"})["text"] == "edited"
+    assert record["text"] == NOTE["text"]  # records handed out earlier keep their text
+    assert records._blobs.dead == len(NOTE["text"].encode("utf-8"))
+    assert dict(reopen(store).find_by_id("n1")) == {**NOTE, "text": "edited"}
+
+
+def test_maintain_rewrites_mostly_dead_text_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(store_module, "TEXT_REPACK_MIN_BYTES", 100)
+    records = NoteRecords(str(tmp_path))
+    store = FileBackedStore("notes", str(tmp_path / "notes.json"), "id", mode="journal", shared=False,
+                            sync="always", records=records)
+    for i in range(5):
+        store.add({"id": str(i), "text": f"note {i} " + "x" * 20})
+    handed_out = store.find_by_id("0")
+    old_blobs = records._blobs
+
+    for _ in range(3):
+        for i in range(4):
+            store.patch(str(i), {"text": f"edited {i} " + "y" * 20})
+
+    assert records._blobs is not old_blobs
+    assert records._blobs.size < old_blobs.size
+    assert handed_out["text"] == "note 0 " + "x" * 20
+    assert {obj["id"]: obj["text"] for obj in store.find_all()} == {
+        **{str(i): f"edited {i} " + "y" * 20 for i in range(4)}, "4": "note 4 " + "x" * 20}
+
+
+def test_note_records_roll_back(tmp_path):
+    records = NoteRecords(str(tmp_path))
+    store = FileBackedStore("notes", str(tmp_path / "notes.json"), "id", mode="snapshot", shared=False,
+                            sync="always", records=records, list_indexes=("tags",))
+    store.add(NOTE)
+    before = contents(store)
+
+    with pytest.raises(RuntimeError):
+        with store.batch():
+            store.patch("n1", {"text": "edited", "tags": ["#y"]})
+            store.re_id("n1", "n2")
+            raise RuntimeError("abort")
+
+    assert contents(store) == before
+    assert [obj["id"] for obj in store.find_in_list("tags", "#x")] == ["n1"]
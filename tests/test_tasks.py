@@ -0,0 +1,119 @@
+import uuid
+
+import pytest
+
+from app import TASK_PRIORITIES, TaskIndex
+from store import MAX_KEY, FileBackedStore
+
+
+NOTES = [
+    ("a", "high", "2024-01-02"), ("b", "low", "2024-01-02"), ("c", "mid", "2024-01-02"),
+    ("d", "mid", "2024-01-01"), ("e", "high", None), ("f", "low", None), ("g", "low", "2024-01-03"),
+    ("h", "high", "2024-01-03"), ("i", "mid", "2024-01-02"), ("j", "low", "2024-01-01"), ("k", None, "2024-01-01"),
+]
+
+
+@pytest.fixture
+def task_index(tmp_path):
+    store = FileBackedStore("notes", str(tmp_path / "notes.json"), "id", mode="snapshot", shared=False)
+    for key, task, duedate in NOTES:
+        store.add({"id": key, "task": task, "duedate": duedate})
+    return TaskIndex(store)
+
+
+def expected_tasks(priorities, lower="", upper=MAX_KEY):
+    entries = [(duedate or MAX_KEY, TaskIndex.RANKS[task], key) for key, task, duedate in NOTES if task in priorities]
+    return sorted(e for e in entries if e[0] >= lower and (upper is None or e[0] < upper))
+
+
+@pytest.mark.parametrize("priorities", [TASK_PRIORITIES, ("low", "high"), ("mid",), ("high",)])
+@pytest.mark.parametrize("lower, upper", [("", MAX_KEY), ("", None), ("2024-01-02", "2024-01-03"), ("2024-01-02", None)])
+@pytest.mark.parametrize("limit", [1, 2, 3, 100])
+def test_task_query_pages(task_index, priorities, lower, upper, limit):
+    pages = []
+    after = None
+    while True:
+        page = task_index.query(priorities, lower, upper, after, limit)
+        assert len(page) <= limit
+        pages.extend(page)
+        if len(page) < limit:
+            break
+        after = page[-1]
+
+    assert pages == expected_tasks(priorities, lower, upper)
+
+
+def test_task_query_follows_store_changes(task_index):
+    store = task_index._store
+    store.patch("a", {"task": "low", "duedate": "2024-01-01"})
+    store.delete("d")
+    store.re_id("e", "ee")
+
+    assert task_index.query(("low", "mid", "high"), upper=None) == [
+        ("2024-01-01", 2, "a"), ("2024-01-01", 2, "j"), ("2024-01-02", 1, "c"), ("2024-01-02", 1, "i"),
+        ("2024-01-02", 2, "b"), ("2024-01-03", 0, "h"), ("2024-01-03", 2, "g"), (MAX_KEY, 0, "ee"), (MAX_KEY, 2, "f"),
+    ]
+
+
+# ------------------ Routes ------------------
+
+def add_task(client, auth, text):
+    return client.post("/api/notes", json={"text": f"{text} #{uuid.uuid4().hex[:8]}"}, headers=auth).get_json()["note"]
+
+
+def ids(response):
+    return [note["id"] for note in response.get_json()]
+
+
+def test_tasks_due_in_range(client, auth):
+    inside = [add_task(client, auth, "!!!9001-03-02"), add_task(client, auth, "!9001-03-01"), add_task(client, auth, "!!9001-03-02")]
+    add_task(client, auth, "!9001-03-03")
+    add_task(client, auth, "!! no due date")
+
+    response = client.get("/api/tasks/due?from=9001-03-01&to=9001-03-02", headers=auth)
+
+    assert response.status_code == 200
+    assert ids(response) == [inside[1]["id"], inside[0]["id"], inside[2]["id"]]
+
+
+def test_tasks_due_up_to_the_last_date(client, auth):
+    last = add_task(client, auth, "!9999-12-31")
+    add_task(client, auth, "!! no due date")
+
+    response = client.get("/api/tasks/due?from=9999-12-31&to=9999-12-31", headers=auth)
+
+    assert response.status_code == 200
+    assert ids(response) == [last["id"]]
+
+
+@pytest.mark.parametrize("query", ["", "?from=2024-01-01", "?from=2024-01-01&to=2024-13-01", "?from=2024-02-01&to=2024-01-01",
+                                   "?from=2024-01-01&to=2024-01-31&priority=urgent"])
+def test_tasks_due_rejects_bad_parameters(client, auth, query):
+    assert client.get(f"/api/tasks/due{query}", headers=auth).status_code == 400
+
+
+def test_tasks_due_pages_with_cursor(client, auth):
+    created = [add_task(client, auth, f"!{'!' * (i % 3)}9002-01-0{1 + i % 2}") for i in range(7)]
+    expected = [note["id"] for note in sorted(created, key=lambda n: (n["duedate"], TaskIndex.RANKS[n["task"]], n["id"]))]
+
+    seen, url = [], "/api/tasks/due?from=9002-01-01&to=9002-01-02&limit=3"
+    while True:
+        response = client.get(url, headers=auth)
+        seen += ids(response)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        url = f"/api/tasks/due?from=9002-01-01&to=9002-01-02&limit=3&cursor={cursor}"
+
+    assert seen == expected
+
+
+def test_overdue_and_priority_views(client, auth):
+    overdue = add_task(client, auth, "!!!1999-01-01")
+    undated = add_task(client, auth, "!!! no due date")
+
+    assert overdue["id"] in ids(client.get("/api/tasks/overdue?priority=high", headers=auth))
+    assert overdue["id"] not in ids(client.get("/api/tasks/overdue?priority=low", headers=auth))
+    by_priority = ids(client.get("/api/tasks/priority/high?limit=1000", headers=auth))
+    assert by_priority.index(overdue["id"]) < by_priority.index(undated["id"])
+    assert client.get("/api/tasks/priority/urgent", headers=auth).status_code == 400